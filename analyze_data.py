@@ -20,17 +20,19 @@ Run this script after data collection to get:
 1. Data overview and condition distribution
 2. Manipulation check results
 3. Primary hypothesis test (2×2 ANOVA with interaction)
-4. Secondary DV analyses
-5. Mediation analysis preparation
+4. Secondary DV analyses (optional permutation p-values / bootstrap CIs: --permutation)
+5. Moderated mediation (PROCESS Model 8, bootstrap CIs)
 6. Covariate analyses
 7. Exportable CSV files for SPSS/R/jamovi
 """
 
 from __future__ import annotations
 
+import argparse
 import json
 import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from typing import Dict, List, Tuple
 
@@ -38,6 +40,11 @@ import numpy as np
 import pandas as pd
 from scipy import stats
 
+import resampling
+from jsonl_store import jsonl_paths
+from parquet_cache import SOURCE_COLUMN, JsonlCache
+from parquet_cache import available as parquet_cache_available
+
 # Suppress warnings for cleaner output
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -70,6 +77,9 @@ MANIPULATION_CHECKS = {
 
 COVARIATES = ["frustration", "age", "gender"]
 
+# Every DV the report runs a 2×2 ANOVA on (computed together in main)
+ANOVA_DVS = [PRIMARY_DV] + SECONDARY_DVS + ["mediator_composite", "frustration"]
+
 ALL_SURVEY_VARS = [
     "desired_rounds_next_time",
     "improvement_confidence",
@@ -85,62 +95,212 @@ ALL_SURVEY_VARS = [
     "luck_vs_skill",
 ]
 
+# Columns both scripts read per record type (load_record_frames / load_table columns=).
+# Trials are written to TRIAL_EXPORT as stored, so every trial column is read. Summaries
+# skip their nested copies of the trials and post survey, which are records of their own.
+ANALYSIS_COLUMNS = {
+    "post_survey": ["participant_id", "timestamp"] + ALL_SURVEY_VARS,
+    "summary": [
+        "participant_id",
+        "timestamp",
+        "condition_id",
+        "frame_type",
+        "loss_frame",
+        "trial_count",
+        "max_trials",
+        "hits",
+        "near_misses",
+        "losses",
+        "age",
+        "gender",
+        "bdm_course_member",
+    ],
+}
+
 
 # ─── DATA LOADING ─────────────────────────────────────────────────────────────
 
 
-def parse_records(data_dir: str = DATA_DIR) -> pd.DataFrame:
-    """Load all records from JSONL files."""
-    if not os.path.exists(data_dir):
-        raise FileNotFoundError(f"No '{data_dir}' directory found.")
+RECORD_TYPES = ["trial", "post_survey", "summary"]
+# Files per pool task; per-participant layouts have thousands of tiny files
+LOAD_CHUNK_FILES = 64
+
 
-    records: List[Dict] = []
+class _ColumnBuilder:
+    """Column lists for one record_type, padded with None where a record lacks a key."""
 
-    # Load JSONL files
-    jsonl_files = glob(os.path.join(data_dir, "*.jsonl"))
-    for path in jsonl_files:
-        with open(path, "r", encoding="utf-8") as f:
-            for line_num, line in enumerate(f, start=1):
-                line = line.strip()
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, List] = {}
+        self.sources: List[str] = []
+
+    def add(self, record: Dict, source: str = ""):
+        columns = self.columns
+        if record.keys() == columns.keys():
+            # Usual case: same keys as every earlier record of this type
+            for key, value in record.items():
+                columns[key].append(value)
+        else:
+            for key in record.keys() - columns.keys():
+                columns[key] = [None] * self.rows
+            for key, column in columns.items():
+                column.append(record.get(key))
+        self.sources.append(source)
+        self.rows += 1
+
+    def extend(self, other: "_ColumnBuilder"):
+        for key in other.columns.keys() - self.columns.keys():
+            self.columns[key] = [None] * self.rows
+        for key, column in self.columns.items():
+            column.extend(other.columns.get(key) or [None] * other.rows)
+        self.sources.extend(other.sources)
+        self.rows += other.rows
+
+    def frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({key: _column_array(column) for key, column in self.columns.items()})
+        if "timestamp" in df.columns:
+            # Explicit ISO8601: an inferred format depends on which rows come first (cache parts)
+            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", format="ISO8601")
+        df[SOURCE_COLUMN] = self.sources
+        return df
+
+
+def _parse_files(
+    tasks: List[Tuple[str, int]],
+) -> Tuple[Dict[str, _ColumnBuilder], List[str], Dict[str, int]]:
+    """Pool task: parse JSONL files from a byte offset into per-record_type columns.
+
+    Returns the builders, warnings, and the offset each file was read up to.
+    A final line without a newline is still being written and is left for later.
+    """
+    builders: Dict[str, _ColumnBuilder] = {}
+    warnings_out: List[str] = []
+    ends: Dict[str, int] = {}
+    for path, offset in tasks:
+        with open(path, "rb", buffering=1024 * 1024) as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                offset += len(raw)
+                line = raw.strip()
                 if not line:
                     continue
                 try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    print(f"Warning: could not parse {path}:{line_num}")
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    warnings_out.append(f"Warning: could not parse {path} at byte {offset - len(raw)}")
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                builder = builders.get(record.get("record_type"))
+                if builder is None:
+                    builder = builders[record.get("record_type")] = _ColumnBuilder()
+                builder.add(record, path)
+        ends[path] = offset
+    return builders, warnings_out, ends
+
+
+def _column_array(values: List):
+    """Typed array for a column: int64, float64 (None -> NaN) or bool; other columns as-is.
+
+    Integers that do not fit int64 (or float64) give an object column of
+    Python ints instead of raising.
+    """
+    kinds = set(map(type, values))
+    try:
+        if kinds == {int}:
+            return np.array(values, dtype=np.int64)
+        if kinds & {int, float} and kinds <= {int, float, type(None)}:
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    except OverflowError:
+        # A Series, not a list or array: pandas would re-infer those and overflow again
+        return pd.Series(values, dtype=object)
+    if kinds == {bool}:
+        return np.array(values, dtype=bool)
+    return values
+
+
+def _parse_parallel(
+    tasks: List[Tuple[str, int]], workers: int | None = None
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, int]]:
+    """Parse (path, offset) tasks in a process pool; one frame per record_type, with SOURCE_COLUMN."""
+    chunks = [tasks[i:i + LOAD_CHUNK_FILES] for i in range(0, len(tasks), LOAD_CHUNK_FILES)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_parse_files, chunks))
+    else:
+        results = [_parse_files(chunk) for chunk in chunks]
+
+    # Merge chunk results in file order
+    builders: Dict[str, _ColumnBuilder] = {}
+    ends: Dict[str, int] = {}
+    for chunk_builders, chunk_warnings, chunk_ends in results:
+        for message in chunk_warnings:
+            print(message)
+        for record_type, builder in chunk_builders.items():
+            if record_type in builders:
+                builders[record_type].extend(builder)
+            else:
+                builders[record_type] = builder
+        ends.update(chunk_ends)
+    builders.pop(None, None)
+    return {record_type: b.frame() for record_type, b in builders.items()}, ends
+
+
+def load_record_frames(
+    data_dir: str = DATA_DIR,
+    workers: int | None = None,
+    columns: Dict[str, List[str]] | None = None,
+    use_cache: bool = True,
+) -> Dict[str, pd.DataFrame]:
+    """Load all JSONL records as one DataFrame per record_type.
+
+    Files are parsed in a process pool (``workers`` processes, default one per
+    CPU) straight into typed columns, so no list of record dicts is built.
+    With pyarrow installed the parsed columns are kept in a Parquet cache
+    (parquet_cache.py) and only new or grown files are parsed again.
+    ``columns`` maps record_type -> columns to read. Always has "trial",
+    "post_survey" and "summary" keys (possibly empty).
+    """
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"No '{data_dir}' directory found.")
+
+    paths = jsonl_paths(data_dir)
+    if use_cache and parquet_cache_available():
+        cache = JsonlCache(data_dir)
+        cache.refresh(paths, lambda tasks: _parse_parallel(tasks, workers))
+        frames = cache.read(columns)
+    else:
+        frames, _ = _parse_parallel([(path, 0) for path in paths], workers)
+        for record_type, df in frames.items():
+            df = df.drop(columns=[SOURCE_COLUMN])
+            wanted = (columns or {}).get(record_type)
+            frames[record_type] = df if wanted is None else df[[c for c in wanted if c in df.columns]]
 
     # Legacy JSON fallback
-    json_files = glob(os.path.join(data_dir, "*.json"))
-    for path in json_files:
+    legacy: Dict[str, _ColumnBuilder] = {}
+    for path in glob(os.path.join(data_dir, "*.json")):
         try:
             with open(path, "r", encoding="utf-8") as f:
                 obj = json.load(f)
-                if isinstance(obj, dict):
-                    records.append(obj)
+            if isinstance(obj, dict) and obj.get("record_type") is not None:
+                legacy.setdefault(obj["record_type"], _ColumnBuilder()).add(obj, path)
         except Exception:
             print(f"Warning: skipping unreadable legacy file {path}")
-
-    if not records:
+    for record_type, builder in legacy.items():
+        df = builder.frame().drop(columns=[SOURCE_COLUMN])
+        wanted = (columns or {}).get(record_type)
+        if wanted is not None:
+            df = df[[c for c in wanted if c in df.columns]]
+        frames[record_type] = pd.concat([frames[record_type], df], ignore_index=True) if record_type in frames else df
+
+    if not any(len(df) for df in frames.values()):
         raise ValueError(f"No records found in '{data_dir}'.")
-
-    df = pd.DataFrame(records)
-    if "timestamp" in df.columns:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-
-    return df
-
-
-def split_record_types(
-    df: pd.DataFrame,
-) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Split records into trials, surveys, and summaries."""
-    if "record_type" not in df.columns:
-        raise ValueError("Missing 'record_type' column in loaded data.")
-
-    trials = df[df["record_type"] == "trial"].copy()
-    survey = df[df["record_type"] == "post_survey"].copy()
-    summary = df[df["record_type"] == "summary"].copy()
-    return trials, survey, summary
+    for record_type in RECORD_TYPES:
+        frames.setdefault(record_type, pd.DataFrame(columns=["record_type", "participant_id"]))
+    return frames
 
 
 def latest_per_participant(
@@ -247,7 +407,7 @@ def sig_stars(p: float) -> str:
 
 
 def print_data_overview(
-    records_df: pd.DataFrame,
+    total_records: int,
     trials_df: pd.DataFrame,
     participants_df: pd.DataFrame,
 ) -> pd.DataFrame:
@@ -258,7 +418,7 @@ def print_data_overview(
     real_participants = participants_df[~participants_df.get("is_dev", False)].copy()
     dev_participants = participants_df[participants_df.get("is_dev", False)].copy()
 
-    print(f"\nTotal records loaded: {len(records_df)}")
+    print(f"\nTotal records loaded: {total_records}")
     print(f"Trial records: {len(trials_df)}")
     print(f"Real participants: {len(real_participants)}")
     print(f"Dev/test participants (excluded): {len(dev_participants)}")
@@ -396,127 +556,146 @@ def print_manipulation_checks(df: pd.DataFrame):
             print(f"Note: {low_cred} participants ({pct:.1f}%) rated credibility < 3")
 
 
-def compute_2x2_anova(df: pd.DataFrame, dv: str) -> Dict:
-    """Compute 2×2 ANOVA statistics using sum of squares decomposition."""
-    if not {"frame_type", "loss_frame"}.issubset(df.columns) or dv not in df.columns:
-        return {}
-
-    # Clean data
-    data = df[["frame_type", "loss_frame", dv]].dropna().copy()
-    data[dv] = pd.to_numeric(data[dv], errors="coerce")
-    data = data.dropna()
-    
-    if len(data) < 8:
-        return {}
-
-    # Check we have all 4 cells
-    cells_present = data.groupby(["frame_type", "loss_frame"]).size()
-    if len(cells_present) < 4:
-        return {}
-
-    # Grand mean
-    grand_mean = data[dv].mean()
-    n_total = len(data)
-
-    # Cell statistics
-    cells = data.groupby(["frame_type", "loss_frame"])[dv].agg(["mean", "count", "std"])
-    cells.columns = ["mean", "n", "sd"]
-
-    # Marginal means
-    frame_means = data.groupby("frame_type")[dv].mean()
-    loss_means = data.groupby("loss_frame")[dv].mean()
-    frame_ns = data.groupby("frame_type")[dv].count()
-    loss_ns = data.groupby("loss_frame")[dv].count()
-
-    # Sum of squares calculations
-    ss_total = ((data[dv] - grand_mean) ** 2).sum()
-
-    # SS for frame_type (main effect A)
-    ss_frame = sum(
-        frame_ns.get(ft, 0) * (frame_means.get(ft, grand_mean) - grand_mean) ** 2
-        for ft in ["skill", "luck"]
-    )
+def compute_2x2_anova_batch(df: pd.DataFrame, dvs: List[str]) -> Dict[str, Dict]:
+    """Compute 2×2 ANOVA statistics for several DVs at once.
 
-    # SS for loss_frame (main effect B)
-    ss_loss = sum(
-        loss_ns.get(lf, 0) * (loss_means.get(lf, grand_mean) - grand_mean) ** 2
-        for lf in ["near_miss", "clear_loss"]
+    Cell counts and sums for every DV come from one matrix product with the
+    cell indicator matrix, and each sum of squares is a masked NumPy
+    reduction over all DVs together. Returns dv -> the compute_2x2_anova()
+    result ({} where that DV has too little data).
+    """
+    if not {"frame_type", "loss_frame"}.issubset(df.columns):
+        return {dv: {} for dv in dvs}
+    present = [dv for dv in dvs if dv in df.columns]
+    results: Dict[str, Dict] = {dv: {} for dv in dvs}
+    if not present:
+        return results
+
+    keyed = df["frame_type"].notna().to_numpy() & df["loss_frame"].notna().to_numpy()
+    frame_type = df["frame_type"].to_numpy()[keyed]
+    loss_frame = df["loss_frame"].to_numpy()[keyed]
+    y = np.column_stack(
+        [pd.to_numeric(df[dv], errors="coerce").to_numpy(dtype=float)[keyed] for dv in present]
     )
-
-    # SS for interaction (using cell means)
-    ss_cells = 0
-    for (ft, lf), row in cells.iterrows():
-        ss_cells += row["n"] * (row["mean"] - grand_mean) ** 2
+    valid = ~np.isnan(y)
+    y0 = np.where(valid, y, 0.0)
+
+    # Cells in groupby order; indicator[i, c] = 1 when row i is in cell c
+    cell_keys = sorted(set(zip(frame_type, loss_frame)))
+    cell_index = {key: c for c, key in enumerate(cell_keys)}
+    codes = np.array([cell_index[key] for key in zip(frame_type, loss_frame)], dtype=np.intp)
+    indicator = np.zeros((len(codes), len(cell_keys)))
+    indicator[np.arange(len(codes)), codes] = 1.0
+
+    cell_n = indicator.T @ valid.astype(float)  # cells × DVs
+    cell_sum = indicator.T @ y0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_mean = cell_sum / cell_n
+    n_total = cell_n.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grand_mean = cell_sum.sum(axis=0) / n_total
+
+    # Deviations from the grand mean and from each row's cell mean (0 where missing)
+    ss_total = (np.where(valid, y - grand_mean, 0.0) ** 2).sum(axis=0)
+    within = np.where(valid, y - cell_mean[codes], 0.0) ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_sd = np.sqrt((indicator.T @ within) / (cell_n - 1))
+
+    def main_effect_ss(position: int, levels: List[str]) -> np.ndarray:
+        ss = np.zeros(len(present))
+        for level in levels:
+            rows = [c for c, key in enumerate(cell_keys) if key[position] == level]
+            level_n = cell_n[rows].sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                level_mean = cell_sum[rows].sum(axis=0) / level_n
+            ss += np.where(level_n > 0, level_n * (level_mean - grand_mean) ** 2, 0.0)
+        return ss
+
+    ss_frame = main_effect_ss(0, ["skill", "luck"])
+    ss_loss = main_effect_ss(1, ["near_miss", "clear_loss"])
+    ss_cells = np.where(cell_n > 0, cell_n * (cell_mean - grand_mean) ** 2, 0.0).sum(axis=0)
     ss_interaction = ss_cells - ss_frame - ss_loss
-
-    # SS error (residual)
     ss_error = ss_total - ss_frame - ss_loss - ss_interaction
-    ss_error = max(ss_error, 0.001)  # Prevent division by zero
+    ss_error = np.maximum(ss_error, 0.001)  # Prevent division by zero
 
-    # Degrees of freedom
-    df_frame = 1
-    df_loss = 1
-    df_interaction = 1
+    df_effect = 1
     df_error = n_total - 4
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ms_error = ss_error / df_error
+        f_frame = (ss_frame / df_effect) / ms_error
+        f_loss = (ss_loss / df_effect) / ms_error
+        f_interaction = (ss_interaction / df_effect) / ms_error
+
+    # P-values for every DV and effect in one call
+    p_frame, p_loss, p_interaction = 1 - stats.f.cdf(
+        np.vstack([f_frame, f_loss, f_interaction]), df_effect, df_error
+    )
 
-    if df_error <= 0:
-        return {}
+    eta_frame = ss_frame / (ss_frame + ss_error)
+    eta_loss = ss_loss / (ss_loss + ss_error)
+    eta_interaction = ss_interaction / (ss_interaction + ss_error)
 
-    # Mean squares
-    ms_frame = ss_frame / df_frame
-    ms_loss = ss_loss / df_loss
-    ms_interaction = ss_interaction / df_interaction
-    ms_error = ss_error / df_error
+    cell_index_names = pd.MultiIndex.from_tuples(cell_keys, names=["frame_type", "loss_frame"])
+    for j, dv in enumerate(present):
+        observed = cell_n[:, j] > 0
+        if n_total[j] < 8 or observed.sum() < 4 or df_error[j] <= 0:
+            continue
+        cells = pd.DataFrame(
+            {
+                "mean": cell_mean[observed, j],
+                "n": cell_n[observed, j].astype(np.int64),
+                "sd": cell_sd[observed, j],
+            },
+            index=cell_index_names[observed],
+        )
+        error_df = int(df_error[j])
+        results[dv] = {
+            "cells": cells,
+            "grand_mean": grand_mean[j],
+            "n_total": int(n_total[j]),
+            "frame_type": {
+                "SS": ss_frame[j],
+                "F": f_frame[j],
+                "df": (df_effect, error_df),
+                "p": p_frame[j],
+                "eta_sq": eta_frame[j],
+            },
+            "loss_frame": {
+                "SS": ss_loss[j],
+                "F": f_loss[j],
+                "df": (df_effect, error_df),
+                "p": p_loss[j],
+                "eta_sq": eta_loss[j],
+            },
+            "interaction": {
+                "SS": ss_interaction[j],
+                "F": f_interaction[j],
+                "df": (df_effect, error_df),
+                "p": p_interaction[j],
+                "eta_sq": eta_interaction[j],
+            },
+            "error": {
+                "SS": ss_error[j],
+                "df": error_df,
+                "MS": ms_error[j],
+            },
+        }
+    return results
 
-    # F statistics
-    f_frame = ms_frame / ms_error
-    f_loss = ms_loss / ms_error
-    f_interaction = ms_interaction / ms_error
 
-    # P-values
-    p_frame = 1 - stats.f.cdf(f_frame, df_frame, df_error)
-    p_loss = 1 - stats.f.cdf(f_loss, df_loss, df_error)
-    p_interaction = 1 - stats.f.cdf(f_interaction, df_interaction, df_error)
+def compute_2x2_anova(df: pd.DataFrame, dv: str) -> Dict:
+    """Compute 2×2 ANOVA statistics using sum of squares decomposition."""
+    return compute_2x2_anova_batch(df, [dv])[dv]
 
-    # Effect sizes (partial eta squared)
-    eta_frame = ss_frame / (ss_frame + ss_error)
-    eta_loss = ss_loss / (ss_loss + ss_error)
-    eta_interaction = ss_interaction / (ss_interaction + ss_error)
 
-    return {
-        "cells": cells,
-        "grand_mean": grand_mean,
-        "n_total": n_total,
-        "frame_type": {
-            "SS": ss_frame,
-            "F": f_frame,
-            "df": (df_frame, df_error),
-            "p": p_frame,
-            "eta_sq": eta_frame,
-        },
-        "loss_frame": {
-            "SS": ss_loss,
-            "F": f_loss,
-            "df": (df_loss, df_error),
-            "p": p_loss,
-            "eta_sq": eta_loss,
-        },
-        "interaction": {
-            "SS": ss_interaction,
-            "F": f_interaction,
-            "df": (df_interaction, df_error),
-            "p": p_interaction,
-            "eta_sq": eta_interaction,
-        },
-        "error": {
-            "SS": ss_error,
-            "df": df_error,
-            "MS": ms_error,
-        },
-    }
-
-
-def print_primary_analysis(df: pd.DataFrame):
+def anova_result(df: pd.DataFrame, dv: str, anova: Dict[str, Dict] | None = None) -> Dict:
+    """Precomputed result for ``dv`` from compute_2x2_anova_batch(), else compute it."""
+    if anova and anova.get(dv):
+        return anova[dv]
+    return compute_2x2_anova(df, dv)
+
+
+def print_primary_analysis(df: pd.DataFrame, anova: Dict[str, Dict] | None = None):
     """Print primary hypothesis test (2×2 ANOVA on primary DV)."""
     print_header("3. PRIMARY ANALYSIS: Interaction Effect")
 
@@ -525,7 +704,7 @@ def print_primary_analysis(df: pd.DataFrame):
     print("\nHypothesis: The near-miss effect on persistence is LARGER in the")
     print("skill condition than in the luck condition (positive interaction).")
 
-    results = compute_2x2_anova(df, dv)
+    results = anova_result(df, dv, anova)
 
     if not results:
         print("\n⚠️ Insufficient data for ANOVA (need data in all 4 cells).")
@@ -594,7 +773,7 @@ def print_primary_analysis(df: pd.DataFrame):
             print("  Near-miss feedback increases persistence regardless of skill/luck framing.")
 
 
-def print_secondary_analyses(df: pd.DataFrame):
+def print_secondary_analyses(df: pd.DataFrame, anova: Dict[str, Dict] | None = None):
     """Print analyses for secondary DVs."""
     print_header("4. SECONDARY ANALYSES")
 
@@ -605,7 +784,7 @@ def print_secondary_analyses(df: pd.DataFrame):
 
         print_subheader(f"DV: {dv}")
 
-        results = compute_2x2_anova(df, dv)
+        results = anova_result(df, dv, anova)
         if not results:
             print("Insufficient data for analysis.")
             continue
@@ -634,8 +813,106 @@ def print_secondary_analyses(df: pd.DataFrame):
             print("  ✗ No significant interaction")
 
 
-def print_mediation_analysis(df: pd.DataFrame):
-    """Print mediation analysis preparation and correlations."""
+CELL_CODES = {
+    ("luck", "clear_loss"): 0,
+    ("luck", "near_miss"): 1,
+    ("skill", "clear_loss"): 2,
+    ("skill", "near_miss"): 3,
+}
+
+
+def cell_coded(df: pd.DataFrame, dv: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer cell codes (CELL_CODES) and float values of ``dv`` for rows with all three."""
+    codes = pd.Series(list(zip(df["frame_type"], df["loss_frame"])), index=df.index).map(CELL_CODES)
+    values = pd.to_numeric(df[dv], errors="coerce")
+    keep = codes.notna() & values.notna()
+    return codes[keep].to_numpy(dtype=np.intp), values[keep].to_numpy(dtype=float)
+
+
+def print_resampling_analysis(
+    df: pd.DataFrame,
+    anova: Dict[str, Dict] | None = None,
+    resamples: int = resampling.DEFAULT_RESAMPLES,
+    seed: int | None = resampling.DEFAULT_SEED,
+    max_permutations: int = resampling.DEFAULT_PERMUTATIONS,
+    tolerance: float = resampling.DEFAULT_PERM_TOLERANCE,
+):
+    """Print permutation p-values and bootstrap CIs for the manipulation checks and 2×2 ANOVAs."""
+    print_header("4b. PERMUTATION TESTS & BOOTSTRAP CIs")
+    print("\nCondition labels are shuffled to get p-values without the normality")
+    print(f"assumption (up to {max_permutations} permutations, stopping once each p is known")
+    print(f"to ±{tolerance}); CIs come from {resamples} within-cell bootstrap resamples.")
+    level = 95
+    ci_level = int(round(resampling.PERM_CI_LEVEL * 100))
+
+    print_subheader("4b-i. Manipulation Checks (Welch t)")
+    checks = [(var, "frame_type", "skill") for var in MANIPULATION_CHECKS["skill_framing"]]
+    checks += [(var, "loss_frame", "near_miss") for var in MANIPULATION_CHECKS["near_miss_framing"]]
+    for var, factor, level_one in checks:
+        if var not in df.columns or factor not in df.columns:
+            continue
+        values = pd.to_numeric(df[var], errors="coerce")
+        keep = values.notna() & df[factor].notna()
+        groups = (df.loc[keep, factor] == level_one).to_numpy(dtype=np.intp)
+        if min(groups.sum(), len(groups) - groups.sum()) < 2:
+            continue
+        result = resampling.permutation_test(
+            groups, values[keep].to_numpy(dtype=float), 2, resampling.welch_t,
+            max_permutations=max_permutations, tolerance=tolerance, seed=seed,
+        )
+        if np.isnan(result["p"][0]):
+            print(f"{var} by {factor}: t is undefined (no variance within a group)")
+            continue
+        lo, hi = result["p_ci"][0]
+        stars = sig_stars(result["p"][0])
+        print(f"{var} by {factor}: |t| = {result['observed'][0]:.3f}, "
+              f"permutation p = {result['p'][0]:.4f}{stars} ({ci_level}% CI [{lo:.4f}, {hi:.4f}], "
+              f"{result['permutations']} permutations)")
+
+    effects = [("frame_type", "Frame type"), ("loss_frame", "Loss frame"), ("interaction", "Interaction")]
+    for dv in [PRIMARY_DV] + SECONDARY_DVS:
+        if dv not in df.columns or not {"frame_type", "loss_frame"}.issubset(df.columns):
+            continue
+        print_subheader(f"4b-ii. {dv}")
+        results = anova_result(df, dv, anova)
+        codes, values = cell_coded(df, dv)
+        if not results or np.bincount(codes, minlength=4).min() < 2:
+            print("Insufficient data for analysis.")
+            continue
+
+        perm = resampling.permutation_test(
+            codes, values, 4, resampling.anova_2x2_f,
+            max_permutations=max_permutations, tolerance=tolerance, seed=seed,
+        )
+        print(f"({perm['permutations']} permutations)")
+        for j, (key, label) in enumerate(effects):
+            lo, hi = perm["p_ci"][j]
+            stars = sig_stars(perm["p"][j])
+            print(f"  {label:<12} F = {results[key]['F']:.3f}, F-test p = {results[key]['p']:.4f}, "
+                  f"permutation p = {perm['p'][j]:.4f}{stars} ({ci_level}% CI [{lo:.4f}, {hi:.4f}])")
+
+        means = resampling.bootstrap_cell_means(codes, values, 4, resamples=resamples, seed=seed)
+        observed = np.bincount(codes, weights=values, minlength=4) / np.bincount(codes, minlength=4)
+        ci = resampling.percentile_ci(means, level / 100)
+        print(f"\nCell means ({level}% bootstrap CIs):")
+        for (ft, lf), c in CELL_CODES.items():
+            print(f"  {ft.capitalize()} × {lf.replace('_', '-')}: M = {observed[c]:.2f} [{ci[c, 0]:.2f}, {ci[c, 1]:.2f}]")
+
+        # (skill NM - skill CL) - (luck NM - luck CL)
+        weights = np.array([1.0, -1.0, -1.0, 1.0])
+        contrast = means @ weights
+        lo, hi = resampling.percentile_ci(contrast[:, None], level / 100)[0]
+        marker = " ✓ excludes 0" if resampling.ci_excludes_zero((lo, hi)) else ""
+        print(f"Interaction contrast: {observed @ weights:.3f} [{lo:.3f}, {hi:.3f}]{marker}")
+
+
+def print_mediation_analysis(
+    df: pd.DataFrame,
+    anova: Dict[str, Dict] | None = None,
+    resamples: int = resampling.DEFAULT_RESAMPLES,
+    seed: int | None = resampling.DEFAULT_SEED,
+):
+    """Print mediator descriptives, correlations and the bootstrapped Model 8 estimates."""
     print_header("5. MEDIATION ANALYSIS (Rationality Confound)")
 
     print("\nResearch Question: Is the interaction driven by rational updating")
@@ -676,7 +953,7 @@ def print_mediation_analysis(df: pd.DataFrame):
 
         # ANOVA on mediator
         print("\nANOVA on mediator composite:")
-        results = compute_2x2_anova(df, "mediator_composite")
+        results = anova_result(df, "mediator_composite", anova)
         if results:
             inter = results["interaction"]
             stars = sig_stars(inter["p"])
@@ -704,32 +981,82 @@ def print_mediation_analysis(df: pd.DataFrame):
             elif r > 0 and p < 0.05:
                 print("  Significant positive correlation")
 
-    # Instructions for full mediation
-    print_subheader("5d. How to Test Mediation")
-    print("""
-To formally test whether mediator explains the interaction, use:
-
-SPSS:  PROCESS macro (Model 8 for moderated mediation)
-       - X = loss_frame (0=clear_loss, 1=near_miss)
-       - M = mediator_composite  
-       - Y = desired_rounds_next_time
-       - W = frame_type (0=luck, 1=skill)
-
-R:     mediation package or lavaan
-       
-Interpretation:
-- If indirect effect is significant AND direct effect becomes non-significant:
-  → FULL MEDIATION (rational updating explains the effect)
-  
-- If both indirect and direct effects significant:
-  → PARTIAL MEDIATION (both mechanisms at play)
-  
-- If only direct effect significant:
-  → NO MEDIATION (bias-driven, not rational)
-""")
+    # Moderated mediation (PROCESS Model 8)
+    print_subheader("5d. Moderated Mediation (PROCESS Model 8)")
+    print_moderated_mediation(df, resamples, seed)
+
+
+def print_moderated_mediation(
+    df: pd.DataFrame,
+    resamples: int = resampling.DEFAULT_RESAMPLES,
+    seed: int | None = resampling.DEFAULT_SEED,
+):
+    """Print the Model 8 paths and bootstrapped conditional indirect effects."""
+    needed = {"frame_type", "loss_frame", "mediator_composite", PRIMARY_DV}
+    if not needed.issubset(df.columns):
+        print("\n⚠️ Missing variables for moderated mediation.")
+        return
 
+    data = pd.DataFrame({
+        "x": df["loss_frame"].map({"clear_loss": 0.0, "near_miss": 1.0}),
+        "w": df["frame_type"].map({"luck": 0.0, "skill": 1.0}),
+        "m": pd.to_numeric(df["mediator_composite"], errors="coerce"),
+        "y": pd.to_numeric(df[PRIMARY_DV], errors="coerce"),
+    }).dropna()
+    print("X = loss_frame (0=clear_loss, 1=near_miss), W = frame_type (0=luck, 1=skill)")
+    print(f"M = mediator_composite, Y = {PRIMARY_DV}")
+
+    results = resampling.moderated_mediation(
+        data["x"].to_numpy(), data["w"].to_numpy(), data["m"].to_numpy(), data["y"].to_numpy(),
+        resamples=resamples, seed=seed,
+    )
+    if not results:
+        print("\n⚠️ Model could not be fit (an empty cell, or no variation in the mediator).")
+        return
 
-def print_covariate_analysis(df: pd.DataFrame):
+    print(f"\nn = {results['n']}, bootstrap resamples = {results['resamples']} "
+          f"({results['valid_resamples']} usable), seed = {results['seed']}")
+    for model, label in (("mediator", "M ~ X + W + X×W"), ("outcome", "Y ~ X + W + X×W + M")):
+        print(f"\n{label}:")
+        for name, path in results["paths"][model].items():
+            stars = sig_stars(path["p"])
+            print(f"  {name:<8} b = {path['coef']:7.3f}, SE = {path['se']:.3f}, "
+                  f"t = {path['t']:7.3f}, p = {path['p']:.4f}{stars}")
+
+    level = int(round(results["level"] * 100))
+    print(f"\nEffects of X ({level}% bootstrap CIs):")
+    labels = [
+        ("indirect_luck", "Indirect, luck"),
+        ("indirect_skill", "Indirect, skill"),
+        ("index_mod_med", "Index of mod. med."),
+        ("direct_luck", "Direct, luck"),
+        ("direct_skill", "Direct, skill"),
+    ]
+    effects = results["effects"]
+    for key, label in labels:
+        effect = effects[key]
+        lo, hi = effect["percentile_ci"]
+        bca_lo, bca_hi = effect["bca_ci"]
+        print(f"  {label:<19} {effect['estimate']:7.3f} (boot SE {effect['boot_se']:.3f})  "
+              f"percentile [{lo:.3f}, {hi:.3f}]  BCa [{bca_lo:.3f}, {bca_hi:.3f}]")
+
+    # Interpretation from the BCa intervals
+    index_sig = resampling.ci_excludes_zero(effects["index_mod_med"]["bca_ci"])
+    direct_sig = any(resampling.ci_excludes_zero(effects[k]["bca_ci"]) for k in ("direct_luck", "direct_skill"))
+    if index_sig and not direct_sig:
+        print("\n✓ Moderated mediation with no remaining direct effect")
+        print("  → FULL MEDIATION (rational updating explains the effect)")
+    elif index_sig:
+        print("\n✓ Moderated mediation alongside a direct effect")
+        print("  → PARTIAL MEDIATION (both mechanisms at play)")
+    elif direct_sig:
+        print("\nIndex of moderated mediation CI includes 0; direct effect present")
+        print("  → NO MEDIATION (bias-driven, not rational)")
+    else:
+        print("\nIndex of moderated mediation CI includes 0")
+
+
+def print_covariate_analysis(df: pd.DataFrame, anova: Dict[str, Dict] | None = None):
     """Print covariate analyses."""
     print_header("6. ADDITIONAL ANALYSES")
 
@@ -737,7 +1064,7 @@ def print_covariate_analysis(df: pd.DataFrame):
     print_subheader("6a. Frustration by Condition")
     
     if "frustration" in df.columns and {"frame_type", "loss_frame"}.issubset(df.columns):
-        results = compute_2x2_anova(df, "frustration")
+        results = anova_result(df, "frustration", anova)
         if results:
             print("\nCell means:")
             cells = results["cells"].reset_index()
@@ -915,7 +1242,68 @@ def print_summary(df: pd.DataFrame):
 # ─── MAIN ─────────────────────────────────────────────────────────────────────
 
 
+def positive_int(value: str) -> int:
+    """argparse type: an integer >= 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """argparse type: a number > 0."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+def add_resampling_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--bootstrap",
+        type=positive_int,
+        default=resampling.DEFAULT_RESAMPLES,
+        help=f"Bootstrap resamples for the mediation and cell-mean CIs. Default: {resampling.DEFAULT_RESAMPLES}",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=resampling.DEFAULT_SEED,
+        help="Seed for the bootstrap and permutation draws (same seed, same results).",
+    )
+    parser.add_argument(
+        "--permutation",
+        action="store_true",
+        help="Add permutation p-values and bootstrap CIs for the manipulation checks and 2x2 ANOVAs.",
+    )
+    parser.add_argument(
+        "--max-permutations",
+        type=positive_int,
+        default=resampling.DEFAULT_PERMUTATIONS,
+        help=f"Upper limit on permutations per test. Default: {resampling.DEFAULT_PERMUTATIONS}",
+    )
+    parser.add_argument(
+        "--perm-tolerance",
+        type=positive_float,
+        default=resampling.DEFAULT_PERM_TOLERANCE,
+        help=f"Stop permuting once each p-value is known to within this. Default: {resampling.DEFAULT_PERM_TOLERANCE}",
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyze local JSONL experiment data.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse every JSONL file instead of using the Parquet cache (experiment_data/.parquet_cache/).",
+    )
+    add_resampling_args(parser)
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     print("\n" + "=" * 70)
     print("   NEAR-MISS EXPERIMENT: COMPREHENSIVE ANALYSIS REPORT")
     print("=" * 70)
@@ -924,15 +1312,15 @@ def main():
 
     # Load data
     try:
-        records = parse_records(DATA_DIR)
+        frames = load_record_frames(DATA_DIR, columns=ANALYSIS_COLUMNS, use_cache=not args.no_cache)
     except Exception as exc:
         print(f"\n❌ Error loading data: {exc}")
         print("\nMake sure you have data in the 'experiment_data' directory.")
         print("Run the experiment first to generate data.")
         return
 
-    # Split and build tables
-    trials, survey, summary = split_record_types(records)
+    # Build tables
+    trials, survey, summary = (frames[t] for t in RECORD_TYPES)
     participants = build_participant_table(summary, survey)
 
     if participants.empty:
@@ -940,14 +1328,19 @@ def main():
         return
 
     # Run all analyses
-    analysis_df = print_data_overview(records, trials, participants)
+    analysis_df = print_data_overview(sum(len(f) for f in frames.values()), trials, participants)
     print_condition_distribution(analysis_df)
     print_demographics(analysis_df)
     print_manipulation_checks(analysis_df)
-    print_primary_analysis(analysis_df)
-    print_secondary_analyses(analysis_df)
-    print_mediation_analysis(analysis_df)
-    print_covariate_analysis(analysis_df)
+    anova = compute_2x2_anova_batch(analysis_df, ANOVA_DVS)
+    print_primary_analysis(analysis_df, anova)
+    print_secondary_analyses(analysis_df, anova)
+    if args.permutation:
+        print_resampling_analysis(
+            analysis_df, anova, args.bootstrap, args.seed, args.max_permutations, args.perm_tolerance
+        )
+    print_mediation_analysis(analysis_df, anova, args.bootstrap, args.seed)
+    print_covariate_analysis(analysis_df, anova)
     print_exclusion_analysis(analysis_df)
 
     # Create and export summary tables
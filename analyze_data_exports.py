@@ -24,6 +24,7 @@ import urllib.parse
 import urllib.request
 
 import analyze_data as core
+import parquet_cache
 
 
 def _read_json_any(path: str) -> pd.DataFrame:
@@ -57,10 +58,7 @@ def _read_json_any(path: str) -> pd.DataFrame:
     return pd.DataFrame()
 
 
-def load_table(path: str, expected_record_type: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"File not found: {path}")
-
+def _read_table(path: str, expected_record_type: str) -> pd.DataFrame:
     lower = path.lower()
     if lower.endswith(".csv"):
         df = pd.read_csv(path)
@@ -81,6 +79,25 @@ def load_table(path: str, expected_record_type: str) -> pd.DataFrame:
     return df
 
 
+def load_table(
+    path: str,
+    expected_record_type: str,
+    columns: List[str] | None = None,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """Load one export file, through the Parquet cache when pyarrow is installed."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+
+    if use_cache and parquet_cache.available():
+        return parquet_cache.cached_table(path, lambda p: _read_table(p, expected_record_type), columns)
+
+    df = _read_table(path, expected_record_type)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Run analysis from separate Supabase export files."
@@ -126,6 +143,12 @@ def parse_args() -> argparse.Namespace:
         default=1000,
         help="Rows per Supabase API page. Default: 1000",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-read export files instead of using the Parquet cache (.parquet_cache/).",
+    )
+    core.add_resampling_args(parser)
     return parser.parse_args()
 
 
@@ -220,11 +243,15 @@ def main():
             )
         else:
             print(f"[analysis] reading trials file: {args.trials}")
-            trials = load_table(args.trials, "trial")
+            trials = load_table(args.trials, "trial", use_cache=not args.no_cache)
             print(f"[analysis] reading surveys file: {args.surveys}")
-            surveys = load_table(args.surveys, "post_survey")
+            surveys = load_table(
+                args.surveys, "post_survey", core.ANALYSIS_COLUMNS["post_survey"], use_cache=not args.no_cache
+            )
             print(f"[analysis] reading summaries file: {args.summaries}")
-            summaries = load_table(args.summaries, "summary")
+            summaries = load_table(
+                args.summaries, "summary", core.ANALYSIS_COLUMNS["summary"], use_cache=not args.no_cache
+            )
     except Exception as exc:
         print(f"\n❌ Error loading input data: {exc}")
         return
@@ -233,8 +260,6 @@ def main():
         print("\n❌ All input files are empty. Nothing to analyze.")
         return
 
-    print("[analysis] building combined records dataframe...")
-    records = pd.concat([trials, surveys, summaries], ignore_index=True, sort=False)
     print("[analysis] building participant-level table...")
     participants = core.build_participant_table(summaries.copy(), surveys.copy())
 
@@ -243,21 +268,27 @@ def main():
         return
 
     print("[analysis] section 1: data overview")
-    analysis_df = core.print_data_overview(records, trials, participants)
+    analysis_df = core.print_data_overview(len(trials) + len(surveys) + len(summaries), trials, participants)
     print("[analysis] section 1b: condition distribution")
     core.print_condition_distribution(analysis_df)
     print("[analysis] section 1c: demographics")
     core.print_demographics(analysis_df)
     print("[analysis] section 2: manipulation checks")
     core.print_manipulation_checks(analysis_df)
+    anova = core.compute_2x2_anova_batch(analysis_df, core.ANOVA_DVS)
     print("[analysis] section 3: primary analysis")
-    core.print_primary_analysis(analysis_df)
+    core.print_primary_analysis(analysis_df, anova)
     print("[analysis] section 4: secondary analyses")
-    core.print_secondary_analyses(analysis_df)
+    core.print_secondary_analyses(analysis_df, anova)
+    if args.permutation:
+        print("[analysis] section 4b: permutation tests and bootstrap CIs")
+        core.print_resampling_analysis(
+            analysis_df, anova, args.bootstrap, args.seed, args.max_permutations, args.perm_tolerance
+        )
     print("[analysis] section 5: mediation analysis")
-    core.print_mediation_analysis(analysis_df)
+    core.print_mediation_analysis(analysis_df, anova, args.bootstrap, args.seed)
     print("[analysis] section 6: covariate analysis")
-    core.print_covariate_analysis(analysis_df)
+    core.print_covariate_analysis(analysis_df, anova)
     print("[analysis] section 7: data quality")
     core.print_exclusion_analysis(analysis_df)
 
@@ -1,10 +1,37 @@
+import atexit
+import gzip
+import hashlib
+import hmac
 import json
+import mimetypes
 import os
 import random
 from datetime import datetime
+from types import MappingProxyType
 
 from dotenv import load_dotenv
-from flask import Flask, Response, jsonify, render_template, request, session
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    render_template,
+    request,
+    send_from_directory,
+    session,
+    stream_with_context,
+    url_for,
+)
+
+from jsonl_store import JsonlAppender, SegmentedLog
+from storage import (
+    EXPORT_FIELDS,
+    TABLES,
+    JsonlStorage,
+    MemoryStorage,
+    PostgresStorage,
+    SQLiteStorage,
+    tally_outcomes,
+)
 
 load_dotenv()
 
@@ -16,19 +43,25 @@ DATABASE_URL = os.environ.get("DATABASE_URL")
 db = None
 
 if DATABASE_URL:
-    from sqlalchemy import text
     from flask_sqlalchemy import SQLAlchemy
 
+    import db_config
+    from migrations import run_migrations
+
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
     if DATABASE_URL.startswith("postgresql://"):
         DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
     app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_config.engine_options()
     db = SQLAlchemy(app)
 
     class Trial(db.Model):
         __tablename__ = "trials"
+        __table_args__ = (
+            db.Index("ix_trials_participant_trial", "participant_id", "trial_number"),
+        )
         id = db.Column(db.Integer, primary_key=True)
         participant_id = db.Column(db.String(50))
         timestamp = db.Column(db.String(50))
@@ -45,6 +78,7 @@ if DATABASE_URL:
 
     class PostSurvey(db.Model):
         __tablename__ = "post_surveys"
+        __table_args__ = (db.Index("ix_post_surveys_participant_id", "participant_id"),)
         id = db.Column(db.Integer, primary_key=True)
         participant_id = db.Column(db.String(50))
         timestamp = db.Column(db.String(50))
@@ -67,6 +101,7 @@ if DATABASE_URL:
 
     class Summary(db.Model):
         __tablename__ = "summaries"
+        __table_args__ = (db.Index("ix_summaries_participant_id", "participant_id"),)
         id = db.Column(db.Integer, primary_key=True)
         participant_id = db.Column(db.String(50))
         timestamp = db.Column(db.String(50))
@@ -94,14 +129,58 @@ if DATABASE_URL:
         is_dev = db.Column(db.Boolean, default=False)
         completed = db.Column(db.Boolean, default=False)
 
+    class ConditionCounter(db.Model):
+        """Non-dev assignment/completion counts per condition, one row per condition."""
+        __tablename__ = "condition_counters"
+        condition_id = db.Column(db.String(50), primary_key=True)
+        assigned = db.Column(db.Integer, nullable=False, default=0)
+        completed = db.Column(db.Integer, nullable=False, default=0)
+
     with app.app_context():
         db.create_all()
+        run_migrations(db.engine)
+
+    def reset_engine_after_fork():
+        with app.app_context():
+            db_config.dispose_after_fork(db.engine)
 
-# Local file storage fallback
+    def warm_up_engine():
+        with app.app_context():
+            return db_config.warm_pool(db.engine)
+
+    # gunicorn --preload (or any fork) must not share pooled sockets with the parent
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=reset_engine_after_fork)
+
+# Local data directory (JSONL records, SQLite files, write-behind spills)
 DATA_DIR = "experiment_data"
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Server-side sessions: the cookie carries only an opaque id (SESSION_BACKEND=cookie to opt out)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "postgres" if db else "sqlite").lower()
+
+if SESSION_BACKEND != "cookie":
+    from session_store import MemoryStore, PostgresStore, ServerSideSessionInterface, SQLiteStore
+
+    if SESSION_BACKEND == "memory":
+        session_store = MemoryStore(max_entries=int(os.environ.get("SESSION_MEMORY_MAX_ENTRIES", "10000")))
+    elif SESSION_BACKEND == "sqlite":
+        session_store = SQLiteStore(
+            os.environ.get("SESSION_SQLITE_PATH", os.path.join(DATA_DIR, ".sessions.sqlite3"))
+        )
+    elif SESSION_BACKEND == "postgres":
+        if not db:
+            raise RuntimeError("SESSION_BACKEND=postgres requires DATABASE_URL")
+        with app.app_context():
+            session_store = PostgresStore(db.engine)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+
+    app.session_interface = ServerSideSessionInterface(
+        session_store, ttl=int(os.environ.get("SESSION_TTL", "86400"))
+    )
+
 # Experiment configuration
 MAX_TRIALS = 5
 BAR_DURATION = 1500
@@ -110,6 +189,90 @@ MAX_SPEED = 0.9
 TARGET_ZONE_WIDTH = 10
 NEAR_MISS_BAND = 15
 
+CONDITION_IDS = [
+    "skill_near_miss",
+    "skill_clear_loss",
+    "luck_near_miss",
+    "luck_clear_loss",
+]
+
+EXPORT_BATCH_SIZE = 1000
+CSV_EXPORT_CHUNK_BYTES = 64 * 1024
+# JSON bodies at least this large are gzipped for clients that accept it
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+LEAN_SUMMARY_FIELDS = [
+    "participant_id",
+    "condition_id",
+    "trial_count",
+    "max_trials",
+    "hits",
+    "near_misses",
+    "losses",
+]
+
+# Record storage (see storage.py): postgres with DATABASE_URL, otherwise JSONL files
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "postgres" if db else "jsonl").lower()
+
+if STORAGE_BACKEND == "postgres":
+    if not db:
+        raise RuntimeError("STORAGE_BACKEND=postgres requires DATABASE_URL")
+    storage = PostgresStorage(
+        app,
+        db,
+        {"trials": Trial, "post_surveys": PostSurvey, "summaries": Summary, "assignments": Assignment},
+        ConditionCounter,
+        CONDITION_IDS,
+    )
+elif STORAGE_BACKEND == "jsonl":
+    # JSONL layout: one file per participant (default) or a shared segmented log.
+    # Readers scan both, so switching layouts never hides existing records.
+    JSONL_LAYOUT = os.environ.get("JSONL_LAYOUT", "participant").lower()
+    JSONL_FSYNC = os.environ.get("JSONL_FSYNC", "none").lower()
+    JSONL_FSYNC_INTERVAL = float(os.environ.get("JSONL_FSYNC_INTERVAL", "1.0"))
+    if JSONL_LAYOUT == "segmented":
+        jsonl_appender = SegmentedLog(
+            DATA_DIR,
+            max_bytes=int(os.environ.get("JSONL_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024))),
+            fsync=JSONL_FSYNC,
+            fsync_interval=JSONL_FSYNC_INTERVAL,
+        )
+    else:
+        # Pooled O_APPEND handles for the per-participant JSONL files
+        jsonl_appender = JsonlAppender(
+            DATA_DIR,
+            max_open=int(os.environ.get("JSONL_MAX_OPEN_FILES", "128")),
+            fsync=JSONL_FSYNC,
+            fsync_interval=JSONL_FSYNC_INTERVAL,
+        )
+    storage = JsonlStorage(DATA_DIR, jsonl_appender, CONDITION_IDS)
+elif STORAGE_BACKEND == "sqlite":
+    storage = SQLiteStorage(
+        os.environ.get("STORAGE_SQLITE_PATH", os.path.join(DATA_DIR, "experiment.sqlite3")),
+        CONDITION_IDS,
+    )
+elif STORAGE_BACKEND == "memory":
+    storage = MemoryStorage(CONDITION_IDS)
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+# Optional write-behind for trial/survey/summary inserts (postgres and sqlite backends)
+if STORAGE_BACKEND in ("postgres", "sqlite") and os.environ.get("WRITE_BEHIND", "").lower() in (
+    "1",
+    "true",
+    "yes",
+):
+    from write_behind import WriteBehindQueue
+
+    storage.write_behind = WriteBehindQueue(
+        storage.flush,
+        spill_dir=os.environ.get("WRITE_BEHIND_SPILL_DIR", os.path.join(DATA_DIR, "write_behind")),
+        max_batch=int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "50")),
+        max_delay=float(os.environ.get("WRITE_BEHIND_MAX_DELAY", "2.0")),
+    )
+
+atexit.register(storage.close)
+
 
 def parse_int(value, default=0):
     try:
@@ -118,226 +281,156 @@ def parse_int(value, default=0):
         return default
 
 
-def assign_balanced_condition():
-    """Assign new participant to whichever condition has fewest *completions*."""
-    all_conditions = [
-        ("skill", "near_miss"),
-        ("skill", "clear_loss"),
-        ("luck", "near_miss"),
-        ("luck", "clear_loss"),
-    ]
-    counts = {f"{ft}_{lf}": 0 for ft, lf in all_conditions}
-
-    if db:
-        from sqlalchemy import func
-
-        rows = (
-            db.session.query(Assignment.condition_id, func.count(Assignment.id))
-            .filter(
-                ~Assignment.participant_id.like("DEV_%"),
-                Assignment.completed == True
-            )
-            .group_by(Assignment.condition_id)
-            .all()
-        )
-        for condition_id, count in rows:
-            if condition_id in counts:
-                counts[condition_id] = count
-    else:
-        # Count assignments from local jsonl files
-        if os.path.exists(DATA_DIR):
-            for filename in os.listdir(DATA_DIR):
-                if not filename.endswith(".jsonl") or filename.startswith("DEV_"):
-                    continue
-                filepath = os.path.join(DATA_DIR, filename)
-                with open(filepath, "r", encoding="utf-8") as f:
-                    for line in f:
-                        line = line.strip()
-                        if line:
-                            record = json.loads(line)
-                            if record.get("record_type") == "assignment" and record.get("completed") is True:
-                                cid = record.get("condition_id")
-                                if cid in counts:
-                                    counts[cid] += 1
-
-    # Pick randomly among conditions tied at the lowest count
-    min_count = min(counts.values())
-    least_filled = [c for c, n in counts.items() if n == min_count]
-    chosen = random.choice(least_filled)
-    frame_type, loss_frame = chosen.split("_", 1)
-    return frame_type, loss_frame
-
-
-def save_record(participant_id, record_type, data):
-    timestamp = datetime.now().isoformat()
-    data["timestamp"] = timestamp
-
-    if db:
-        common = dict(
-            participant_id=participant_id,
-            timestamp=timestamp,
-            condition_id=data.get("condition_id"),
-            frame_type=data.get("frame_type"),
-            loss_frame=data.get("loss_frame"),
-        )
-        if record_type == "trial":
-            record = Trial(
-                **common,
-                trial_number=data.get("trial_number"),
-                bar_position=data.get("bar_position"),
-                target_zone_start=data.get("target_zone_start"),
-                target_zone_end=data.get("target_zone_end"),
-                distance_from_center=data.get("distance_from_center"),
-                true_outcome=data.get("true_outcome"),
-                framed_outcome=data.get("framed_outcome"),
-            )
-        elif record_type == "post_survey":
-            record = PostSurvey(
-                **common,
-                wants_more_rounds=data.get("wants_more_rounds"),
-                desired_rounds_next_time=data.get("desired_rounds_next_time"),
-                improvement_confidence=data.get("improvement_confidence"),
-                learning_potential=data.get("learning_potential"),
-                expected_success=data.get("expected_success"),
-                app_download_likelihood=data.get("app_download_likelihood"),
-                confidence_impact=data.get("confidence_impact"),
-                feedback_credibility=data.get("feedback_credibility"),
-                self_rated_accuracy=data.get("self_rated_accuracy"),
-                final_round_closeness=data.get("final_round_closeness"),
-                frustration=data.get("frustration"),
-                motivation=data.get("motivation"),
-                luck_vs_skill=data.get("luck_vs_skill"),
-            )
-        elif record_type == "summary":
-            record = Summary(
-                **common,
-                trial_count=data.get("trial_count"),
-                hits=data.get("hits"),
-                near_misses=data.get("near_misses"),
-                losses=data.get("losses"),
-                age=data.get("age"),
-                gender=data.get("gender"),
-                bdm_course_member=data.get("bdm_course_member"),
-            )
-        else:
-            return
-        db.session.add(record)
-        db.session.commit()
-    else:
-        filename = f"{DATA_DIR}/{participant_id}.jsonl"
-        with open(filename, "a", encoding="utf-8") as f:
-            f.write(json.dumps(data) + "\n")
-
-
-def save_assignment(participant_id, frame_type, loss_frame, is_dev=False):
-    timestamp = datetime.now().isoformat()
-    condition_id = f"{frame_type}_{loss_frame}"
-    if db:
-        assignment = Assignment.query.filter_by(participant_id=participant_id).first()
-        if assignment is None:
-            assignment = Assignment(
-                participant_id=participant_id,
-                timestamp=timestamp,
-                start_time=timestamp,
-                end_time=None,
-                condition_id=condition_id,
-                frame_type=frame_type,
-                loss_frame=loss_frame,
-                is_dev=bool(is_dev),
-                completed=False,
-            )
-            db.session.add(assignment)
-        else:
-            assignment.timestamp = timestamp
-            assignment.start_time = timestamp
-            assignment.end_time = None
-            assignment.condition_id = condition_id
-            assignment.frame_type = frame_type
-            assignment.loss_frame = loss_frame
-            assignment.is_dev = bool(is_dev)
-            assignment.completed = False
-        db.session.commit()
-    else:
-        record = {
-            "record_type": "assignment",
-            "participant_id": participant_id,
-            "timestamp": timestamp,
-            "start_time": timestamp,
-            "end_time": None,
-            "condition_id": condition_id,
-            "frame_type": frame_type,
-            "loss_frame": loss_frame,
-            "is_dev": bool(is_dev),
-            "completed": False,
-        }
-        filename = f"{DATA_DIR}/{participant_id}.jsonl"
-        with open(filename, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record) + "\n")
+def save_record(record_type, data):
+    data["timestamp"] = datetime.now().isoformat()
+    storage.insert(TABLES[record_type], data)
 
 
-def build_frame(frame_type, loss_frame):
-    if frame_type == "skill":
-        title = "Reaction Time Challenge"
-        description = (
+FRAME_TEXT = {
+    "skill": {
+        "title": "Reaction Time Challenge",
+        "description": (
             "In this game, a bar moves across the screen. "
             "Your goal is to press STOP at the right moment to land it in the green zone. "
             "This is a test of your reaction time and timing precision. "
             "Most people find they get a better feel for the timing as they go — "
             "so pay attention and try to improve with each round."
-        )
-        icon = "TARGET"
-    else:
-        title = "Number Draw Game"
-        description = (
+        ),
+        "icon": "TARGET",
+    },
+    "luck": {
+        "title": "Number Draw Game",
+        "description": (
             "In this game, a number between 1 and 100 is randomly drawn each round. "
             "The green zone on the wheel shows the winning interval. "
             "If the drawn number falls inside the green zone, you win that round. "
             "The outcome is entirely determined by chance — "
             "some people hit lucky streaks, others have to wait for their luck to turn."
-        )
-        icon = "CLOVER"
+        ),
+        "icon": "CLOVER",
+    },
+}
+
+# Built once at import; keyed by (frame_type, loss_frame) and never mutated
+FRAMES = MappingProxyType({
+    (frame_type, loss_frame): MappingProxyType(dict(FRAME_TEXT[frame_type]))
+    for frame_type, loss_frame in (condition_id.split("_", 1) for condition_id in CONDITION_IDS)
+})
+
+
+def _frame_response(frame):
+    body = json.dumps(dict(frame)).encode("utf-8")
+    return body, hashlib.sha256(body).hexdigest()[:16]
+
+
+# Serialized frame bodies and their ETags for /api/get-frame
+FRAME_RESPONSES = MappingProxyType({key: _frame_response(frame) for key, frame in FRAMES.items()})
+
+# Feedback lines keyed by (frame_type, outcome); hit and neutral_loss show no text
+FEEDBACK_MESSAGES = MappingProxyType({
+    ("skill", "near_miss"): (
+        "So close! Just a tiny bit off — you almost had it.",
+        "Nearly! Your timing was just a fraction away.",
+        "Agonisingly close. One small adjustment and you'd have nailed it.",
+        "So close it hurts! You were right on the edge of the zone.",
+    ),
+    ("luck", "near_miss"): (
+        "So close! The number landed just outside your zone.",
+        "Agonisingly close — just one number away from winning.",
+        "Nearly! The wheel stopped just short of your zone.",
+        "So close it hurts! Almost in the zone.",
+    ),
+    ("skill", "loss"): (
+        "Not quite — the bar was pretty far from the zone this round.",
+        "Missed by a fair amount this time. Keep trying.",
+        "That one was quite a bit off. Better luck next round.",
+    ),
+    ("luck", "loss"): (
+        "No luck this round — the number landed well outside your zone.",
+        "Pretty far off this time. The wheel wasn't kind.",
+        "That one wasn't close. Hopefully next round is better.",
+    ),
+})
 
-    return {"title": title, "description": description, "icon": icon}
+
+def build_frame(frame_type, loss_frame):
+    return dict(FRAMES[(frame_type, loss_frame)])
 
 
 def generate_feedback(outcome, distance_from_center, frame_type="skill"):
-    if outcome == "hit":
+    if outcome in ("hit", "neutral_loss"):
         return ""
+    frame_type = "skill" if frame_type == "skill" else "luck"
+    outcome = "near_miss" if outcome == "near_miss" else "loss"
+    return random.choice(FEEDBACK_MESSAGES[(frame_type, outcome)])
+
+
+@app.after_request
+def gzip_json(response):
+    """Compress large JSON bodies; streamed responses (CSV, NDJSON, files) pass through."""
+    if (
+        response.status_code != 200
+        or response.mimetype != "application/json"
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not request.accept_encodings["gzip"]
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.content_encoding = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
 
-    if outcome == "near_miss":
-        if frame_type == "skill":
-            messages = [
-                "So close! Just a tiny bit off — you almost had it.",
-                "Nearly! Your timing was just a fraction away.",
-                "Agonisingly close. One small adjustment and you'd have nailed it.",
-                "So close it hurts! You were right on the edge of the zone.",
-            ]
-        else:
-            messages = [
-                "So close! The number landed just outside your zone.",
-                "Agonisingly close — just one number away from winning.",
-                "Nearly! The wheel stopped just short of your zone.",
-                "So close it hurts! Almost in the zone.",
-            ]
-        return random.choice(messages)
-
-    if outcome == "neutral_loss":
-        return ""
 
-    # clear loss
-    if frame_type == "skill":
-        messages = [
-            "Not quite — the bar was pretty far from the zone this round.",
-            "Missed by a fair amount this time. Keep trying.",
-            "That one was quite a bit off. Better luck next round.",
-        ]
-    else:
-        messages = [
-            "No luck this round — the number landed well outside your zone.",
-            "Pretty far off this time. The wheel wasn't kind.",
-            "That one wasn't close. Hopefully next round is better.",
-        ]
-    return random.choice(messages)
+ASSET_DIST_DIR = os.path.join(app.static_folder, "dist")
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def load_asset_manifest():
+    """Source path -> hashed build name, written by build_assets.py; empty if not built."""
+    try:
+        with open(os.path.join(ASSET_DIST_DIR, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+ASSET_MANIFEST = load_asset_manifest()
+ASSET_FILES = frozenset(ASSET_MANIFEST.values())
+
+
+@app.template_global()
+def asset_url(filename, **values):
+    """URL of the hashed build of a static file, or the plain static URL if not built."""
+    built = ASSET_MANIFEST.get(filename)
+    if built:
+        return url_for("serve_asset", filename=built)
+    return url_for("static", filename=filename, **values)
+
+
+@app.route("/assets/<path:filename>")
+def serve_asset(filename):
+    if filename not in ASSET_FILES:
+        return jsonify({"error": "not found"}), 404
+    served, encoding = filename, None
+    for name, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[name] and os.path.exists(os.path.join(ASSET_DIST_DIR, filename + suffix)):
+            served, encoding = filename + suffix, name
+            break
+    response = send_from_directory(
+        ASSET_DIST_DIR, served, mimetype=mimetypes.guess_type(filename)[0], max_age=ASSET_MAX_AGE
+    )
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    # Names change with content, so clients never need to revalidate
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
 
 
 @app.route("/")
@@ -356,95 +449,24 @@ def export_csv():
     import io
 
     table = request.args.get("table", "trials")
-    output = io.StringIO()
-
-    if db:
-        if table == "trials":
-            rows = Trial.query.all()
-            fields = [
-                "id",
-                "participant_id",
-                "timestamp",
-                "condition_id",
-                "frame_type",
-                "loss_frame",
-                "trial_number",
-                "bar_position",
-                "target_zone_start",
-                "target_zone_end",
-                "distance_from_center",
-                "true_outcome",
-                "framed_outcome",
-            ]
-        elif table == "post_surveys":
-            rows = PostSurvey.query.all()
-            fields = [
-                "id",
-                "participant_id",
-                "timestamp",
-                "condition_id",
-                "frame_type",
-                "loss_frame",
-                "wants_more_rounds",
-                "desired_rounds_next_time",
-                "improvement_confidence",
-                "learning_potential",
-                "expected_success",
-                "app_download_likelihood",
-                "confidence_impact",
-                "feedback_credibility",
-                "self_rated_accuracy",
-                "final_round_closeness",
-                "frustration",
-                "motivation",
-                "luck_vs_skill",
-            ]
-        elif table == "summaries":
-            rows = Summary.query.all()
-            fields = [
-                "id",
-                "participant_id",
-                "timestamp",
-                "condition_id",
-                "frame_type",
-                "loss_frame",
-                "trial_count",
-                "hits",
-                "near_misses",
-                "losses",
-                "age",
-                "gender",
-                "bdm_course_member",
-            ]
-        elif table == "assignments":
-            rows = Assignment.query.all()
-            fields = [
-                "id",
-                "participant_id",
-                "timestamp",
-                "start_time",
-                "end_time",
-                "condition_id",
-                "frame_type",
-                "loss_frame",
-                "is_dev",
-                "completed",
-            ]
-        else:
-            return jsonify({"error": "unknown table"}), 400
-
-        writer = csv.DictWriter(output, fieldnames=fields)
-        writer.writeheader()
-        for r in rows:
-            writer.writerow({f: getattr(r, f) for f in fields})
-    else:
-        output.write("no database connected\n")
-
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={table}.csv"},
-    )
+    if table not in EXPORT_FIELDS:
+        return jsonify({"error": "unknown table"}), 400
+    headers = {"Content-Disposition": f"attachment; filename={table}.csv"}
+    fields = EXPORT_FIELDS[table]
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in storage.scan(table):
+            writer.writerow([row[f] for f in fields])
+            if buffer.tell() >= CSV_EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype="text/csv", headers=headers)
 
 
 @app.route("/api/start-session", methods=["POST"])
@@ -464,47 +486,15 @@ def start_session():
         "clear_loss",
     ]
 
-    if db and not has_forced_condition:
-        # Lock assignment section so two concurrent starters don't choose the same underfilled bin.
-        db.session.execute(text("SELECT pg_advisory_xact_lock(:lock_key)"), {"lock_key": 20260302})
-        frame_type, loss_frame = assign_balanced_condition()
-        condition_id = f"{frame_type}_{loss_frame}"
-
-        assignment = Assignment.query.filter_by(participant_id=participant_id).first()
-        if assignment is None:
-            assignment_time = datetime.now().isoformat()
-            assignment = Assignment(
-                participant_id=participant_id,
-                timestamp=assignment_time,
-                start_time=assignment_time,
-                end_time=None,
-                condition_id=condition_id,
-                frame_type=frame_type,
-                loss_frame=loss_frame,
-                is_dev=bool(is_dev),
-                completed=False,
-            )
-            db.session.add(assignment)
-        else:
-            assignment_time = datetime.now().isoformat()
-            assignment.timestamp = assignment_time
-            assignment.start_time = assignment_time
-            assignment.end_time = None
-            assignment.condition_id = condition_id
-            assignment.frame_type = frame_type
-            assignment.loss_frame = loss_frame
-            assignment.is_dev = bool(is_dev)
-            assignment.completed = False
-        db.session.commit()
+    if has_forced_condition:
+        frame_type = force_frame_type
+        loss_frame = force_loss_frame
     else:
-        # Dev mode or forced condition: use requested bin.
-        if has_forced_condition:
-            frame_type = force_frame_type
-            loss_frame = force_loss_frame
-        else:
-            frame_type, loss_frame = assign_balanced_condition()
-        condition_id = f"{frame_type}_{loss_frame}"
-        save_assignment(participant_id, frame_type, loss_frame, is_dev=is_dev)
+        frame_type, loss_frame = storage.claim_condition(participant_id)
+    condition_id = f"{frame_type}_{loss_frame}"
+    storage.start_assignment(
+        participant_id, frame_type, loss_frame, is_dev=is_dev, claimed=not has_forced_condition
+    )
 
     age = data.get("age")
     gender = data.get("gender")
@@ -530,6 +520,10 @@ def start_session():
             "loss_frame": loss_frame,
             "condition_id": condition_id,
             "max_trials": MAX_TRIALS,
+            "target_zone_width": TARGET_ZONE_WIDTH,
+            "bar_duration": BAR_DURATION,
+            "trial_schedule": trial_schedule(participant_id),
+            "frame": build_frame(frame_type, loss_frame),
         }
     )
 
@@ -543,18 +537,45 @@ def get_frame():
         "clear_loss",
     ]:
         return jsonify({"error": "Session not initialized"}), 400
-    return jsonify(build_frame(frame_type, loss_frame))
+    body, etag = FRAME_RESPONSES[(frame_type, loss_frame)]
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    # The frame follows the server-side session, which a restart can change without
+    # changing the cookie, so the browser must revalidate (cheap 304 via the ETag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+def trial_params(participant_id, trial_number):
+    """Bar trial parameters for one participant and trial, as (target_zone_start, bar_speed).
+
+    Drawn from a PRNG seeded with HMAC-SHA256(secret key, participant_id:trial_number),
+    so evaluate_trial can recompute them without storing or trusting what the
+    client echoes back. Rounded to what the client displays.
+    """
+    digest = hmac.new(
+        app.secret_key.encode("utf-8"),
+        f"{participant_id}:{trial_number}".encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+    rng = random.Random(int.from_bytes(digest[:8], "big"))
+    bar_speed = rng.uniform(MIN_SPEED, MAX_SPEED)
+    target_zone_start = rng.uniform(30, 50)
+    return round(target_zone_start, 2), round(bar_speed, 3)
+
+
+def trial_schedule(participant_id):
+    """[[target_zone_start, bar_speed], ...] for trials 1..MAX_TRIALS."""
+    return [list(trial_params(participant_id, n)) for n in range(1, MAX_TRIALS + 1)]
 
 
 @app.route("/api/generate-bar-trial", methods=["POST"])
 def generate_bar_trial():
+    # Kept for clients without the trial_schedule from start-session
     data = request.json or {}
     trial_num = parse_int(data.get("trial_number"), 0)
-
-    bar_speed = random.uniform(MIN_SPEED, MAX_SPEED)
-    target_zone_start = random.uniform(30, 50)
-    target_zone_end = target_zone_start + TARGET_ZONE_WIDTH
-    optimal_stop = target_zone_start + (TARGET_ZONE_WIDTH / 2)
+    target_zone_start, bar_speed = trial_params(session.get("participant_id", "unknown"), trial_num)
 
     return jsonify(
         {
@@ -563,17 +584,13 @@ def generate_bar_trial():
             "duration": BAR_DURATION,
             "target_zone_start": target_zone_start,
             "target_zone_width": TARGET_ZONE_WIDTH,
-            "optimal_stop": optimal_stop,
+            "optimal_stop": target_zone_start + (TARGET_ZONE_WIDTH / 2),
         }
     )
 
 
-@app.route("/api/evaluate-trial", methods=["POST"])
-def evaluate_trial():
-    data = request.json or {}
-
-    frame_type = session.get("frame_type", "skill")
-    loss_frame = session.get("loss_frame", "clear_loss")
+def score_trial(data, participant_id, condition_id, frame_type, loss_frame):
+    """Score one trial result; returns (trial row, response fields). No session or storage access."""
     trial_number = parse_int(data.get("trial_number"), 0)
     bar_position = float(data.get("bar_position", 0))
 
@@ -583,8 +600,9 @@ def evaluate_trial():
         target_zone_end = float(data.get("wheel_zone_end", 10))
         target_zone_width = target_zone_end - target_zone_start
     else:
-        target_zone_start = float(data.get("target_zone_start", 0))
-        target_zone_width = float(data.get("target_zone_width", TARGET_ZONE_WIDTH))
+        # Recomputed from the participant's seed; client-sent zone values are ignored
+        target_zone_start, _ = trial_params(participant_id, trial_number)
+        target_zone_width = TARGET_ZONE_WIDTH
         target_zone_end = target_zone_start + target_zone_width
 
     target_center = target_zone_start + (target_zone_width / 2)
@@ -639,8 +657,8 @@ def evaluate_trial():
 
     trial_data = {
         "record_type": "trial",
-        "participant_id": session.get("participant_id", "unknown"),
-        "condition_id": session.get("condition_id"),
+        "participant_id": participant_id,
+        "condition_id": condition_id,
         "frame_type": frame_type,
         "loss_frame": loss_frame,
         "trial_number": trial_number,
@@ -651,27 +669,81 @@ def evaluate_trial():
         "true_outcome": true_outcome,
         "framed_outcome": framed_outcome,
     }
+    result = {
+        "trial_number": trial_number,
+        "true_outcome": true_outcome,
+        "framed_outcome": framed_outcome,
+        "distance_from_center": round(distance_from_center, 2),
+        "feedback": generate_feedback(
+            "neutral_loss" if (framed_outcome == "loss" and trial_number < MAX_TRIALS - 1) else framed_outcome,
+            distance_from_center,
+            frame_type
+        ),
+    }
+    return trial_data, result
+
+
+def session_scorer():
+    """Bind score_trial to the current session's participant and condition."""
+    participant_id = session.get("participant_id", "unknown")
+    condition_id = session.get("condition_id")
+    frame_type = session.get("frame_type", "skill")
+    loss_frame = session.get("loss_frame", "clear_loss")
+    return lambda data: score_trial(data, participant_id, condition_id, frame_type, loss_frame)
+
 
+def append_session_trials(rows):
     trials = session.get("trials", [])
-    trials.append(trial_data)
+    trials.extend(rows)
     session["trials"] = trials
     session["trial_count"] = len(trials)
     session.modified = True
 
-    save_record(trial_data["participant_id"], "trial", trial_data)
+
+@app.route("/api/evaluate-trial", methods=["POST"])
+def evaluate_trial():
+    data = request.json or {}
+
+    trial_data, result = session_scorer()(data)
+    append_session_trials([trial_data])
+    save_record("trial", trial_data)
 
     return jsonify(
         {
             "success": True,
-            "trial_number": trial_number,
-            "true_outcome": true_outcome,
-            "framed_outcome": framed_outcome,
-            "distance_from_center": round(distance_from_center, 2),
-            "feedback": generate_feedback(
-                "neutral_loss" if (framed_outcome == "loss" and trial_number < MAX_TRIALS - 1) else framed_outcome,
-                distance_from_center,
-                frame_type
-            ),
+            **result,
+            "trial_count": session["trial_count"],
+            "max_trials": MAX_TRIALS,
+            "done": session["trial_count"] >= MAX_TRIALS,
+        }
+    )
+
+
+@app.route("/api/evaluate-trials", methods=["POST"])
+def evaluate_trials():
+    """Score a batch of trial results (offline/kiosk clients, replay) and save them together."""
+    data = request.json or {}
+    batch = data.get("trials")
+    if not isinstance(batch, list) or not batch or not all(isinstance(t, dict) for t in batch):
+        return jsonify({"success": False, "error": "trials must be a non-empty list of objects"}), 400
+    if len(batch) > MAX_TRIALS:
+        return jsonify({"success": False, "error": f"at most {MAX_TRIALS} trials per batch"}), 400
+
+    score = session_scorer()
+    scored = [score(t) for t in batch]
+    rows = [trial_data for trial_data, _ in scored]
+
+    timestamp = datetime.now().isoformat()
+    for row in rows:
+        row["timestamp"] = timestamp
+    # One insert_many call: a single transaction on postgres and sqlite
+    storage.insert_many("trials", rows)
+    append_session_trials(rows)
+
+    return jsonify(
+        {
+            "success": True,
+            "results": [result for _, result in scored],
             "trial_count": session["trial_count"],
             "max_trials": MAX_TRIALS,
             "done": session["trial_count"] >= MAX_TRIALS,
@@ -753,7 +825,7 @@ def save_post_survey():
 
     session["post_survey"] = survey
     session.modified = True
-    save_record(survey["participant_id"], "post_survey", survey)
+    save_record("post_survey", survey)
     return jsonify({"success": True})
 
 
@@ -762,139 +834,80 @@ def get_summary():
     participant_id = session.get("participant_id", "unknown")
     trials = session.get("trials", [])
 
-    summary = {
-        "record_type": "summary",
-        "participant_id": participant_id,
-        "condition_id": session.get("condition_id"),
-        "frame_type": session.get("frame_type"),
-        "loss_frame": session.get("loss_frame"),
-        "trial_count": len(trials),
-        "max_trials": MAX_TRIALS,
-        "hits": sum(1 for t in trials if t.get("framed_outcome") == "hit"),
-        "near_misses": sum(1 for t in trials if t.get("framed_outcome") == "near_miss"),
-        "losses": sum(1 for t in trials if t.get("framed_outcome") == "loss"),
-        "trials": trials,
-        "post_survey": session.get("post_survey"),
-        "age": session.get("age"),
-        "gender": session.get("gender"),
-        "bdm_course_member": session.get("bdm_course_member"),
-    }
-
-    if db:
-        assignment = Assignment.query.filter_by(participant_id=participant_id).first()
-        if assignment is not None:
-            assignment.completed = True
-            assignment.end_time = datetime.now().isoformat()
-    else:
-        end_time = datetime.now().isoformat()
-        assignment_complete = {
-            "record_type": "assignment_complete",
+    def build_summary(counts):
+        if counts is None:
+            # Storage can't see every trial yet (JSONL, write-behind): count the session's
+            counts = tally_outcomes(trials)
+        trial_count, hits, near_misses, losses = counts
+        return {
+            "record_type": "summary",
             "participant_id": participant_id,
-            "timestamp": end_time,
-            "end_time": end_time,
-            "completed": True,
+            "condition_id": session.get("condition_id"),
+            "frame_type": session.get("frame_type"),
+            "loss_frame": session.get("loss_frame"),
+            "trial_count": trial_count,
+            "max_trials": MAX_TRIALS,
+            "hits": hits,
+            "near_misses": near_misses,
+            "losses": losses,
+            "trials": trials,
+            "post_survey": session.get("post_survey"),
+            "age": session.get("age"),
+            "gender": session.get("gender"),
+            "bdm_course_member": session.get("bdm_course_member"),
+            "timestamp": datetime.now().isoformat(),
         }
-        filename = f"{DATA_DIR}/{participant_id}.jsonl"
-        with open(filename, "a", encoding="utf-8") as f:
-            f.write(json.dumps(assignment_complete) + "\n")
 
-    save_record(participant_id, "summary", summary)
+    summary = storage.complete_session(participant_id, build_summary)
+    if request.args.get("view") == "lean":
+        # Counts only; the full trials list and survey are already stored
+        return jsonify({"success": True, **{f: summary.get(f) for f in LEAN_SUMMARY_FIELDS}})
     return jsonify(summary)
 
 
 @app.route("/api/export-all-data", methods=["GET"])
 def export_all_data():
-    all_data = []
-
-    if db:
-        for r in Assignment.query.all():
-            all_data.append(
-                {
-                    "record_type": "assignment",
-                    "participant_id": r.participant_id,
-                    "timestamp": r.timestamp,
-                    "start_time": r.start_time,
-                    "end_time": r.end_time,
-                    "condition_id": r.condition_id,
-                    "frame_type": r.frame_type,
-                    "loss_frame": r.loss_frame,
-                    "is_dev": r.is_dev,
-                    "completed": r.completed,
-                }
-            )
-        for r in Trial.query.all():
-            all_data.append(
-                {
-                    "record_type": "trial",
-                    "participant_id": r.participant_id,
-                    "timestamp": r.timestamp,
-                    "condition_id": r.condition_id,
-                    "frame_type": r.frame_type,
-                    "loss_frame": r.loss_frame,
-                    "trial_number": r.trial_number,
-                    "bar_position": r.bar_position,
-                    "target_zone_start": r.target_zone_start,
-                    "target_zone_end": r.target_zone_end,
-                    "distance_from_center": r.distance_from_center,
-                    "true_outcome": r.true_outcome,
-                    "framed_outcome": r.framed_outcome,
-                }
-            )
-        for r in PostSurvey.query.all():
-            all_data.append(
-                {
-                    "record_type": "post_survey",
-                    "participant_id": r.participant_id,
-                    "timestamp": r.timestamp,
-                    "condition_id": r.condition_id,
-                    "frame_type": r.frame_type,
-                    "loss_frame": r.loss_frame,
-                    "wants_more_rounds": r.wants_more_rounds,
-                    "desired_rounds_next_time": r.desired_rounds_next_time,
-                    "improvement_confidence": r.improvement_confidence,
-                    "learning_potential": r.learning_potential,
-                    "expected_success": r.expected_success,
-                    "app_download_likelihood": r.app_download_likelihood,
-                    "confidence_impact": r.confidence_impact,
-                    "feedback_credibility": r.feedback_credibility,
-                    "self_rated_accuracy": r.self_rated_accuracy,
-                    "final_round_closeness": r.final_round_closeness,
-                    "frustration": r.frustration,
-                    "motivation": r.motivation,
-                    "luck_vs_skill": r.luck_vs_skill,
-                }
-            )
-        for r in Summary.query.all():
-            all_data.append(
-                {
-                    "record_type": "summary",
-                    "participant_id": r.participant_id,
-                    "timestamp": r.timestamp,
-                    "condition_id": r.condition_id,
-                    "frame_type": r.frame_type,
-                    "loss_frame": r.loss_frame,
-                    "trial_count": r.trial_count,
-                    "hits": r.hits,
-                    "near_misses": r.near_misses,
-                    "losses": r.losses,
-                    "age": r.age,
-                    "gender": r.gender,
-                    "bdm_course_member": r.bdm_course_member,
-                }
-            )
-    else:
-        for filename in os.listdir(DATA_DIR):
-            if not filename.endswith(".jsonl"):
-                continue
-            filepath = os.path.join(DATA_DIR, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        all_data.append(json.loads(line))
+    since = request.args.get("since")
+
+    if request.args.get("format") == "ndjson":
+
+        def generate():
+            lines = []
+            for record in storage.export_records(since):
+                lines.append(json.dumps(record))
+                if len(lines) >= EXPORT_BATCH_SIZE:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
+    all_data = list(storage.export_records(since))
     return jsonify({"total_records": len(all_data), "data": all_data})
 
 
+storage.prepare()
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations (flask --app app migrate)."""
+    if not db:
+        print("no database connected")
+        return
+    with app.app_context():
+        applied = run_migrations(db.engine)
+    print(f"applied: {', '.join(applied)}" if applied else "schema is up to date")
+
+
+@app.cli.command("reconcile-counters")
+def reconcile_counters_command():
+    """Rebuild balancing counts from stored assignments (flask --app app reconcile-counters)."""
+    counts = storage.reconcile()
+    for condition_id, (assigned, completed) in counts.items():
+        print(f"{condition_id}: assigned={assigned} completed={completed}")
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
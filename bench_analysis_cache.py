@@ -0,0 +1,122 @@
+"""
+Benchmark analysis loading with and without the Parquet cache.
+
+Writes a synthetic JSONL data directory (assignment, 5 trials, post survey,
+summary and completion marker per participant; per-participant files, or one
+segmented log with --segmented), then times analyze_data.load_record_frames():
+
+  cold         no cache, every file parsed
+  cache build  first cached run (parse + write Parquet)
+  warm         cached, nothing changed
+  incremental  cached, after --new more participants were added
+  projected    cached, reading only analyze_data.ANALYSIS_COLUMNS (as the report does)
+
+  pip install pyarrow
+  python bench_analysis_cache.py --participants 100000
+  python bench_analysis_cache.py --participants 100000 --segmented --keep
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import analyze_data
+import parquet_cache
+from jsonl_store import SegmentedLog
+
+
+def participant_records(participant_id, rng):
+    condition_id = rng.choice(["skill_near_miss", "skill_clear_loss", "luck_near_miss", "luck_clear_loss"])
+    frame_type, loss_frame = condition_id.split("_", 1)
+    stamp = f"2026-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+    base = {"participant_id": participant_id, "condition_id": condition_id, "frame_type": frame_type, "loss_frame": loss_frame}
+    records = [{"record_type": "assignment", **base, "timestamp": stamp, "start_time": stamp,
+                "end_time": None, "is_dev": False, "completed": False}]
+    outcomes = []
+    for trial_number in range(1, 6):
+        outcome = rng.choice(["hit", "loss", "near_miss"])
+        outcomes.append(outcome)
+        zone = round(rng.uniform(30, 50), 2)
+        records.append({"record_type": "trial", **base, "trial_number": trial_number,
+                        "bar_position": round(rng.uniform(0, 100), 2), "target_zone_start": zone,
+                        "target_zone_end": zone + 10, "distance_from_center": round(rng.uniform(0, 50), 2),
+                        "true_outcome": outcome, "framed_outcome": outcome, "timestamp": stamp})
+    survey = {var: rng.randint(1, 7) for var in analyze_data.ALL_SURVEY_VARS}
+    survey["desired_rounds_next_time"] = rng.randint(0, 5)
+    survey["expected_success"] = rng.randint(0, 10)
+    records.append({"record_type": "post_survey", **base, **survey,
+                    "wants_more_rounds": survey["desired_rounds_next_time"] >= 3, "timestamp": stamp})
+    records.append({"record_type": "summary", **base, "trial_count": 5, "max_trials": 5,
+                    "hits": outcomes.count("hit"), "near_misses": outcomes.count("near_miss"),
+                    "losses": outcomes.count("loss"), "trials": [], "post_survey": survey,
+                    "age": rng.randint(18, 45), "gender": rng.choice(["male", "female"]),
+                    "bdm_course_member": rng.random() < 0.5, "timestamp": stamp})
+    records.append({"record_type": "assignment_complete", "participant_id": participant_id, "timestamp": stamp})
+    return records
+
+
+def write_participants(data_dir, start, count, segmented, rng):
+    log = SegmentedLog(data_dir) if segmented else None
+    for i in range(start, start + count):
+        participant_id = f"P{i:07d}"
+        lines = [json.dumps(r) + "\n" for r in participant_records(participant_id, rng)]
+        if log:
+            for line in lines:
+                log.append_line(line.encode("utf-8"))
+        else:
+            with open(os.path.join(data_dir, f"{participant_id}.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(lines)
+    if log:
+        log.close()
+
+
+def timed(label, **kwargs):
+    started = time.perf_counter()
+    frames = analyze_data.load_record_frames(**kwargs)
+    elapsed = time.perf_counter() - started
+    rows = sum(len(df) for df in frames.values())
+    print(f"{label:<12} {elapsed:8.2f}s  ({rows} records)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold vs warm analysis loading.")
+    parser.add_argument("--participants", type=int, default=100000, help="Synthetic participants")
+    parser.add_argument("--new", type=int, default=1000, help="Participants added before the incremental run")
+    parser.add_argument("--segmented", action="store_true", help="Write one segmented log instead of per-participant files")
+    parser.add_argument("--workers", type=int, default=None, help="Parse processes (default: one per CPU)")
+    parser.add_argument("--data-dir", default=None, help="Directory to generate into (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated directory")
+    args = parser.parse_args()
+
+    if not parquet_cache.available():
+        raise SystemExit("pyarrow is not installed (pip install pyarrow)")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_analysis_")
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(7)
+    started = time.perf_counter()
+    write_participants(data_dir, 0, args.participants, args.segmented, rng)
+    layout = "segmented" if args.segmented else "per-participant files"
+    print(f"generated {args.participants} participants ({layout}) in {time.perf_counter() - started:.1f}s: {data_dir}")
+
+    try:
+        shutil.rmtree(os.path.join(data_dir, parquet_cache.CACHE_DIR_NAME), ignore_errors=True)
+        cold = timed("cold", data_dir=data_dir, workers=args.workers, use_cache=False)
+        timed("cache build", data_dir=data_dir, workers=args.workers)
+        warm = timed("warm", data_dir=data_dir, workers=args.workers)
+        write_participants(data_dir, args.participants, args.new, args.segmented, rng)
+        timed("incremental", data_dir=data_dir, workers=args.workers)
+        timed("projected", data_dir=data_dir, workers=args.workers, columns=analyze_data.ANALYSIS_COLUMNS)
+        print(f"warm vs cold: {cold / warm:.1f}x faster")
+    finally:
+        if not args.keep and not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
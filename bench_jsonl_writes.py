@@ -0,0 +1,116 @@
+"""
+Benchmark JSONL appends under concurrent writers.
+
+Compares the old open/append/close per record against the pooled O_APPEND
+writer (jsonl_store.JsonlAppender) for each fsync policy. Writers are
+separate processes, like gunicorn workers, all appending to the same set of
+participant files. After each run every line is parsed back to check that no
+record was torn or interleaved.
+
+  python bench_jsonl_writes.py --writers 4 --records 5000 --participants 200
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from jsonl_store import JsonlAppender
+
+
+def sample_record(writer_id, seq, participant_id):
+    return {
+        "record_type": "trial",
+        "participant_id": participant_id,
+        "condition_id": "skill_near_miss",
+        "frame_type": "skill",
+        "loss_frame": "near_miss",
+        "trial_number": seq % 5 + 1,
+        "bar_position": round(random.uniform(0, 100), 2),
+        "target_zone_start": 40.0,
+        "target_zone_end": 50.0,
+        "distance_from_center": 3.21,
+        "true_outcome": "loss",
+        "framed_outcome": "loss",
+        "writer": writer_id,
+        "seq": seq,
+    }
+
+
+def write_open_close(data_dir, writer_id, records, participants, _fsync):
+    for seq in range(records):
+        pid = f"P{random.randrange(participants):05d}"
+        with open(f"{data_dir}/{pid}.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(sample_record(writer_id, seq, pid)) + "\n")
+
+
+def write_pooled(data_dir, writer_id, records, participants, fsync):
+    appender = JsonlAppender(data_dir, max_open=participants, fsync=fsync, fsync_interval=0.05)
+    for seq in range(records):
+        pid = f"P{random.randrange(participants):05d}"
+        appender.append(pid, sample_record(writer_id, seq, pid))
+    appender.close()
+
+
+def verify(data_dir, expected):
+    count = 0
+    for name in os.listdir(data_dir):
+        with open(os.path.join(data_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                json.loads(line)
+                count += 1
+    if count != expected:
+        raise RuntimeError(f"expected {expected} records, found {count}")
+
+
+def run(label, target, writers, records, participants, fsync):
+    data_dir = tempfile.mkdtemp(prefix="bench_jsonl_")
+    try:
+        procs = [
+            mp.Process(target=target, args=(data_dir, w, records, participants, fsync))
+            for w in range(writers)
+        ]
+        started = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - started
+        total = writers * records
+        verify(data_dir, total)
+        print(f"{label:<28} {total:>8} records  {elapsed:7.2f}s  {total / elapsed:>10.0f} rec/s")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSONL append throughput.")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writer processes")
+    parser.add_argument("--records", type=int, default=5000, help="Records per writer")
+    parser.add_argument("--participants", type=int, default=200, help="Distinct participant files")
+    parser.add_argument(
+        "--skip-always",
+        action="store_true",
+        help="Skip fsync=always (slow on spinning disks)",
+    )
+    args = parser.parse_args()
+
+    cases = [
+        ("open/append/close", write_open_close, "none"),
+        ("pooled, fsync=none", write_pooled, "none"),
+        ("pooled, fsync=interval", write_pooled, "interval"),
+    ]
+    if not args.skip_always:
+        cases.append(("pooled, fsync=always", write_pooled, "always"))
+
+    print(f"writers={args.writers} records/writer={args.records} participants={args.participants}")
+    for label, target, fsync in cases:
+        run(label, target, args.writers, args.records, args.participants, fsync)
+
+
+if __name__ == "__main__":
+    main()
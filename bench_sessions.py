@@ -0,0 +1,83 @@
+"""
+Load-test full participant sessions against a running app.
+
+Each client runs complete sessions through run_render_bot.run_one_session()
+(start, frame, 5 trials, survey, summary). Run it once per gunicorn worker
+class against the same single worker to compare concurrent sessions per worker:
+
+  GUNICORN_WORKER_CLASS=sync WEB_CONCURRENCY=1 gunicorn app:app --config gunicorn.conf.py --bind 127.0.0.1:8000
+  GUNICORN_THREADS=8 WEB_CONCURRENCY=1 gunicorn app:app --config gunicorn.conf.py --bind 127.0.0.1:8000
+  GUNICORN_WORKER_CLASS=gevent WEB_CONCURRENCY=1 gunicorn app:app --config gunicorn.conf.py --bind 127.0.0.1:8000
+
+  python bench_sessions.py --url http://127.0.0.1:8000/ --sessions 200 --concurrency 16
+
+Sessions are DEV_ participants unless --real-mode is given.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from bench_start_session import percentile
+from run_render_bot import run_one_session
+
+
+def worker(base_url, n, dev_mode, latencies, errors, lock):
+    for _ in range(n):
+        started = time.perf_counter()
+        try:
+            run_one_session(base_url=base_url, dev_mode=dev_mode)
+        except Exception as exc:
+            with lock:
+                errors.append(str(exc))
+            continue
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent full sessions.")
+    parser.add_argument("--url", required=True, help="Base URL, e.g. http://127.0.0.1:8000/")
+    parser.add_argument("--sessions", type=int, default=100, help="Total sessions")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel participants")
+    parser.add_argument("--real-mode", action="store_true", help="Use P#### instead of DEV_####")
+    args = parser.parse_args()
+
+    base_url = args.url if args.url.endswith("/") else (args.url + "/")
+    concurrency = max(1, args.concurrency)
+    per_worker = max(1, args.sessions // concurrency)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(base_url, per_worker, not args.real_mode, latencies, errors, lock),
+        )
+        for _ in range(concurrency)
+    ]
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    ordered = sorted(latencies)
+    print(f"sessions ok={len(latencies)} failed={len(errors)} concurrency={concurrency} wall={wall:.2f}s")
+    if ordered:
+        print(
+            f"session latency ms: p50={percentile(ordered, 50):.1f} "
+            f"p99={percentile(ordered, 99):.1f} max={ordered[-1]:.1f} "
+            f"mean={statistics.mean(ordered):.1f}"
+        )
+        print(f"throughput: {len(ordered) / wall:.1f} sessions/s")
+    for err in errors[:5]:
+        print(f"error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measure /api/start-session latency against a running app.
+
+Run it once per configuration against a freshly started server, e.g. a local
+Postgres with and without the pool settings from db_config.py:
+
+  DATABASE_URL=postgresql://localhost/nearmiss DB_POOL_PRE_PING=0 DB_WARM_CONNECTIONS=0 \
+      gunicorn app:app --config gunicorn.conf.py --bind 127.0.0.1:8000
+  python bench_start_session.py --url http://127.0.0.1:8000/ --requests 500 --concurrency 8
+
+Sessions are started as DEV_ participants so they never affect balancing.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from run_render_bot import make_opener, post_json
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def worker(base_url, n, latencies, errors, lock):
+    for _ in range(n):
+        # Fresh cookie jar per request, like a new participant
+        opener = make_opener()
+        started = time.perf_counter()
+        try:
+            post_json(opener, base_url, "/api/start-session", {"is_dev": True})
+        except Exception as exc:
+            with lock:
+                errors.append(str(exc))
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/start-session latency.")
+    parser.add_argument("--url", required=True, help="Base URL, e.g. http://127.0.0.1:8000/")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel clients")
+    args = parser.parse_args()
+
+    base_url = args.url if args.url.endswith("/") else (args.url + "/")
+    concurrency = max(1, args.concurrency)
+    per_worker = max(1, args.requests // concurrency)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(base_url, per_worker, latencies, errors, lock))
+        for _ in range(concurrency)
+    ]
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    ordered = sorted(latencies)
+    print(f"requests ok={len(latencies)} failed={len(errors)} wall={wall:.2f}s")
+    if ordered:
+        print(
+            f"start-session latency ms: p50={percentile(ordered, 50):.1f} "
+            f"p99={percentile(ordered, 99):.1f} max={ordered[-1]:.1f} "
+            f"mean={statistics.mean(ordered):.1f}"
+        )
+        print(f"throughput: {len(ordered) / wall:.1f} req/s")
+    for err in errors[:5]:
+        print(f"error: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Build minified, content-hashed and precompressed copies of the frontend assets.
+
+Writes static/dist/<dir>/<name>.<hash>.<ext> plus .gz (and .br when the brotli
+package is installed) next to it, and static/dist/manifest.json mapping each
+source path to its hashed name. app.py reads the manifest at startup: the
+templates' asset_url() then points at /assets/<hashed name>, served with
+immutable cache headers. Without a manifest the plain static files are used.
+
+Minification uses rjsmin / rcssmin when installed; otherwise files are copied
+unminified (still hashed and compressed).
+
+  pip install rjsmin rcssmin brotli
+  python build_assets.py
+
+Run it as part of the deploy build (before gunicorn starts).
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+ASSETS = ["css/style.css", "js/experiment.js"]
+MANIFEST_NAME = "manifest.json"
+
+
+def minify(path, text):
+    """Minified text, or the input unchanged if no minifier is installed."""
+    try:
+        if path.endswith(".js"):
+            from rjsmin import jsmin
+
+            return jsmin(text)
+        if path.endswith(".css"):
+            from rcssmin import cssmin
+
+            return cssmin(text)
+    except ImportError:
+        pass
+    return text
+
+
+def compressors():
+    """(suffix, compress) pairs for the precompressed variants."""
+    # mtime=0 keeps the .gz bytes identical across builds of the same file
+    found = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+
+        found.append((".br", lambda data: brotli.compress(data, quality=11)))
+    except ImportError:
+        pass
+    return found
+
+
+def build(static_dir="static", dist_dir=None):
+    dist_dir = dist_dir or os.path.join(static_dir, "dist")
+    # Every deploy rebuilds from scratch so stale hashes don't accumulate
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    variants = compressors()
+
+    manifest = {}
+    for asset in ASSETS:
+        with open(os.path.join(static_dir, asset), encoding="utf-8") as f:
+            source = f.read()
+        data = minify(asset, source).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(asset)
+        built = f"{stem}.{digest}{ext}"
+
+        out_path = os.path.join(dist_dir, built)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(data)
+        sizes = [f"{len(source.encode('utf-8'))} -> {len(data)}"]
+        for suffix, compress in variants:
+            packed = compress(data)
+            with open(out_path + suffix, "wb") as f:
+                f.write(packed)
+            sizes.append(f"{suffix} {len(packed)}")
+
+        manifest[asset] = built
+        print(f"{asset} -> {built} ({', '.join(sizes)} bytes)")
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed, minified, precompressed assets.")
+    parser.add_argument("--static-dir", default="static", help="Static source directory")
+    args = parser.parse_args()
+    build(args.static_dir)
+
+
+if __name__ == "__main__":
+    main()
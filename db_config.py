@@ -0,0 +1,81 @@
+"""
+SQLAlchemy engine configuration for PostgreSQL mode.
+
+Pool settings come from the environment so they can be tuned per Render
+service without code changes:
+
+  DB_POOL_SIZE          persistent connections per worker (default 5, or
+                        GUNICORN_THREADS if higher, so each thread gets one)
+  DB_MAX_OVERFLOW       extra connections allowed under burst (default 5)
+  DB_POOL_TIMEOUT       seconds to wait for a free connection (default 30)
+  DB_POOL_RECYCLE       seconds before a connection is replaced (default 1800)
+  DB_POOL_PRE_PING      test connections on checkout (default true)
+  DB_WARM_CONNECTIONS   connections opened eagerly per worker (default 2)
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_size():
+    return env_int("DB_POOL_SIZE", max(5, env_int("GUNICORN_THREADS", 1)))
+
+
+def engine_options():
+    """Keyword arguments for ``create_engine`` (``SQLALCHEMY_ENGINE_OPTIONS``)."""
+    return {
+        "pool_size": pool_size(),
+        "max_overflow": env_int("DB_MAX_OVERFLOW", 5),
+        "pool_timeout": env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+def warm_connections():
+    return max(0, min(env_int("DB_WARM_CONNECTIONS", 2), pool_size()))
+
+
+def warm_pool(engine, count=None):
+    """Open ``count`` connections concurrently and return them to the pool.
+
+    Connection setup (and TLS to Supabase) then happens at worker boot
+    instead of on the first participant requests.
+    """
+    count = warm_connections() if count is None else count
+    if count <= 0:
+        return 0
+
+    def connect(_):
+        conn = engine.connect()
+        conn.exec_driver_sql("SELECT 1")
+        return conn
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        conns = list(pool.map(connect, range(count)))
+    for conn in conns:
+        conn.close()
+    return len(conns)
+
+
+def dispose_after_fork(engine):
+    """Drop pooled connections inherited from the parent process.
+
+    ``close=False`` leaves the parent's sockets alone; the child simply
+    forgets them and opens its own on demand.
+    """
+    engine.dispose(close=False)
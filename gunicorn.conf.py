@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for Render (loaded via the Procfile).
+
+Each worker warms its database pool once the app is loaded, so the first
+participants routed to a fresh worker don't pay connection setup and TLS.
+
+Worker classes (GUNICORN_WORKER_CLASS):
+  sync     one request at a time per worker (default)
+  gthread  GUNICORN_THREADS requests per worker, one OS thread each; a
+           request waiting on a Postgres commit no longer blocks the others
+  gevent   GUNICORN_WORKER_CONNECTIONS requests per worker on greenlets
+           (pip install gevent); psycopg 3 yields to the hub while it waits
+           on the server, and the DB pool (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+           caps how many queries run at once
+"""
+
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+# threads > 1 with the sync class makes gunicorn use gthread
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+
+def post_worker_init(worker):
+    import app as app_module
+
+    if app_module.db:
+        opened = app_module.warm_up_engine()
+        worker.log.info("warmed %d database connection(s)", opened)
@@ -0,0 +1,258 @@
+"""
+Append-only JSONL storage for local file mode.
+
+Two layouts:
+  participant  one experiment_data/<participant_id>.jsonl per participant
+               (JsonlAppender, the default)
+  segmented    all records in rotating experiment_data/segments/seg-NNNNNN.jsonl
+               files (SegmentedLog)
+
+iter_jsonl_lines() reads both layouts, so readers work before, during and
+after a migration (see migrate_jsonl_segments.py).
+
+JsonlAppender keeps an LRU pool of open O_APPEND file descriptors keyed by participant, so
+a trial costs one write() instead of an open/write/close. Each record is
+encoded up front and written with a single write() call; with O_APPEND the
+kernel positions every write at end-of-file, so lines from concurrent
+gunicorn workers never interleave or overwrite each other.
+
+fsync policy:
+  none      leave flushing to the OS (same durability as before)
+  always    fsync after every record
+  interval  group commit: a background thread fsyncs files written in the
+            last interval, so many records share one fsync
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process segment lock
+    fcntl = None
+
+FSYNC_POLICIES = ("none", "always", "interval")
+
+SEGMENT_DIR = "segments"
+SEGMENT_RE = re.compile(r"^seg-(\d{6})\.jsonl$")
+
+
+def write_all(fd, data):
+    written = os.write(fd, data)
+    while written < len(data):
+        # Regular files don't short-write in practice; finish the line if one does
+        written += os.write(fd, data[written:])
+
+
+class JsonlAppender:
+    def __init__(self, data_dir, max_open=128, fsync="none", fsync_interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.data_dir = data_dir
+        self.max_open = max(1, max_open)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._fds = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._syncer = None
+        self._stop = threading.Event()
+
+    def path_for(self, participant_id):
+        return f"{self.data_dir}/{participant_id}.jsonl"
+
+    def append(self, participant_id, record):
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            self._check_fork()
+            fd = self._fd(participant_id)
+            write_all(fd, line)
+            self._written(participant_id, fd)
+
+    def sync(self):
+        """fsync every file written since the last sync."""
+        with self._lock:
+            for key in self._dirty:
+                fd = self._fds.get(key)
+                if fd is not None:
+                    os.fsync(fd)
+            self._dirty.clear()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            for key in list(self._fds):
+                self._close_fd(key)
+
+    def _written(self, key, fd):
+        if self.fsync == "always":
+            os.fsync(fd)
+        elif self.fsync == "interval":
+            self._dirty.add(key)
+            self._start_syncer()
+
+    def _fd(self, key):
+        fd = self._fds.get(key)
+        if fd is not None:
+            self._fds.move_to_end(key)
+            return fd
+        while len(self._fds) >= self.max_open:
+            self._close_fd(next(iter(self._fds)))
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        fd = os.open(self.path_for(key), flags, 0o644)
+        self._fds[key] = fd
+        return fd
+
+    def _close_fd(self, key):
+        fd = self._fds.pop(key)
+        if key in self._dirty:
+            os.fsync(fd)
+            self._dirty.discard(key)
+        os.close(fd)
+
+    def _check_fork(self):
+        # Descriptors and the sync thread belong to the parent after a fork
+        if self._pid == os.getpid():
+            return
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        self._dirty.clear()
+        self._syncer = None
+        self._pid = os.getpid()
+
+    def _start_syncer(self):
+        if self._syncer is not None:
+            return
+        self._syncer = threading.Thread(target=self._sync_loop, name="jsonl-fsync", daemon=True)
+        self._syncer.start()
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+
+
+class SegmentedLog(JsonlAppender):
+    """One shared append-only log, rotated once a segment reaches max_bytes.
+
+    Every worker appends to the highest-numbered segment. The worker whose
+    write crosses max_bytes creates the next segment; the others see it on
+    their next append (one stat per record) and follow, so a participant's
+    records never go back to an older segment. Each append holds an flock on
+    its segment from the rotation check through the write, and rotation
+    creates the next segment under the same lock, so no record can land in a
+    segment that was rotated away in between.
+    """
+
+    def __init__(self, data_dir, max_bytes=64 * 1024 * 1024, fsync="none", fsync_interval=1.0):
+        super().__init__(data_dir, max_open=1, fsync=fsync, fsync_interval=fsync_interval)
+        self.segments_dir = os.path.join(data_dir, SEGMENT_DIR)
+        self.max_bytes = max(1, max_bytes)
+        os.makedirs(self.segments_dir, exist_ok=True)
+        numbers = segment_numbers(self.segments_dir)
+        self._segment = numbers[-1] if numbers else 1
+
+    def path_for(self, key):
+        return os.path.join(self.segments_dir, key)
+
+    def append(self, participant_id, record):
+        self.append_line((json.dumps(record) + "\n").encode("utf-8"))
+
+    def append_line(self, line):
+        """Append one encoded JSONL line; returns (segment path, offset)."""
+        with self._lock:
+            self._check_fork()
+            name, fd = self._lock_active_segment()
+            try:
+                write_all(fd, line)
+                # O_APPEND leaves this descriptor's offset at the end of our own write
+                end = os.lseek(fd, 0, os.SEEK_CUR)
+                self._written(name, fd)
+                path = self.path_for(name)
+                if end >= self.max_bytes:
+                    # Next segment exists before the lock on this one is released; opened
+                    # outside the fd pool so it can't evict the locked descriptor
+                    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+                    os.close(os.open(self.path_for(segment_name(self._segment + 1)), flags, 0o644))
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            if end >= self.max_bytes:
+                self._close_segment()
+                self._segment += 1
+            return path, end - len(line)
+
+    def _lock_active_segment(self):
+        """(name, fd) of the newest segment, flock-ed; follows rotations by other workers."""
+        while True:
+            while os.path.exists(self.path_for(segment_name(self._segment + 1))):
+                self._close_segment()
+                self._segment += 1
+            name = segment_name(self._segment)
+            fd = self._fd(name)
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # Re-check under the lock: a rotation always creates the next segment while holding it
+            if not os.path.exists(self.path_for(segment_name(self._segment + 1))):
+                return name, fd
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _close_segment(self):
+        key = segment_name(self._segment)
+        if key in self._fds:
+            self._close_fd(key)
+
+
+def segment_name(number):
+    return f"seg-{number:06d}.jsonl"
+
+
+def segment_numbers(segments_dir):
+    try:
+        names = os.listdir(segments_dir)
+    except OSError:
+        return []
+    return sorted(int(m.group(1)) for m in map(SEGMENT_RE.match, names) if m)
+
+
+def jsonl_paths(data_dir):
+    """Every JSONL file holding records, in read order.
+
+    Per-participant files come first (they hold the older data when a
+    directory is mid-migration), then segments in order.
+    """
+    paths = [
+        os.path.join(data_dir, name)
+        for name in os.listdir(data_dir)
+        if name.endswith(".jsonl")
+    ]
+    segments_dir = os.path.join(data_dir, SEGMENT_DIR)
+    paths += [os.path.join(segments_dir, segment_name(n)) for n in segment_numbers(segments_dir)]
+    return paths
+
+
+def iter_file_lines(path):
+    """Yield (line_number, line) for every non-empty line of one JSONL file."""
+    with open(path, "r", encoding="utf-8", buffering=1024 * 1024) as f:
+        for line_num, line in enumerate(f, start=1):
+            line = line.strip()
+            if line:
+                yield line_num, line
+
+
+def iter_jsonl_lines(data_dir):
+    """Yield (path, line_number, line) for every non-empty stored line, file by file."""
+    for path in jsonl_paths(data_dir):
+        for line_num, line in iter_file_lines(path):
+            yield path, line_num, line
+
+
+def iter_jsonl_records(data_dir):
+    for _, _, line in iter_jsonl_lines(data_dir):
+        yield json.loads(line)
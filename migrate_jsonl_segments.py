@@ -0,0 +1,74 @@
+"""
+Move per-participant JSONL files into the segmented log layout.
+
+Copies every experiment_data/<participant_id>.jsonl into
+experiment_data/segments/ (one participant's lines kept together, in file
+order), reads each line back from the offset it was written at, then moves the
+original file to experiment_data/migrated/ so readers don't count it twice.
+Nothing is deleted.
+
+Stop the app (or run it with JSONL_LAYOUT=segmented) before migrating, and
+set JSONL_LAYOUT=segmented afterwards.
+
+  python migrate_jsonl_segments.py
+  python migrate_jsonl_segments.py --data-dir experiment_data --dry-run
+"""
+
+import argparse
+import os
+import shutil
+
+from jsonl_store import SegmentedLog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate per-participant JSONL files to segments.")
+    parser.add_argument("--data-dir", default="experiment_data", help="JSONL data directory")
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=int(os.environ.get("JSONL_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024))),
+        help="Segment rotation size in bytes (default: JSONL_SEGMENT_MAX_BYTES or 64 MiB)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="List what would be migrated")
+    args = parser.parse_args()
+
+    names = sorted(name for name in os.listdir(args.data_dir) if name.endswith(".jsonl"))
+    if not names:
+        print(f"No per-participant files in '{args.data_dir}'.")
+        return
+    if args.dry_run:
+        for name in names:
+            print(f"would migrate {name}")
+        print(f"{len(names)} files")
+        return
+
+    log = SegmentedLog(args.data_dir, max_bytes=args.max_bytes, fsync="always")
+    migrated_dir = os.path.join(args.data_dir, "migrated")
+    os.makedirs(migrated_dir, exist_ok=True)
+
+    total = 0
+    for name in names:
+        path = os.path.join(args.data_dir, name)
+        with open(path, "rb") as f:
+            lines = [line.strip() + b"\n" for line in f if line.strip()]
+        written = [log.append_line(line) for line in lines]
+
+        # Read every line back from its segment before giving up the original
+        for line, (segment_path, offset) in zip(lines, written):
+            with open(segment_path, "rb") as f:
+                f.seek(offset)
+                if f.read(len(line)) != line:
+                    log.close()
+                    raise SystemExit(f"ERROR: {name} does not match its segment copy; stopping")
+
+        shutil.move(path, os.path.join(migrated_dir, name))
+        total += len(lines)
+
+    log.close()
+    print(f"Migrated {len(names)} files ({total} records) into {log.segments_dir}")
+    print(f"Originals moved to {migrated_dir}")
+
+
+if __name__ == "__main__":
+    main()
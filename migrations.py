@@ -0,0 +1,86 @@
+"""
+Schema migrations for PostgreSQL mode.
+
+db.create_all() only creates missing tables; it never alters existing ones.
+Each migration below is applied once, in order, and recorded in
+schema_migrations. Statements are idempotent so databases that were patched
+by hand (see STATUS.md history) migrate cleanly.
+
+Add new migrations to the end of MIGRATIONS; never edit an applied one.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+# Arbitrary key so concurrently booting workers apply migrations one at a time
+MIGRATION_LOCK_KEY = 20260310
+
+MIGRATIONS = [
+    (
+        "0001_summaries_bdm_course_member",
+        [
+            "ALTER TABLE summaries ADD COLUMN IF NOT EXISTS bdm_course_member BOOLEAN",
+        ],
+    ),
+    (
+        "0002_assignments_session_times",
+        [
+            "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS start_time VARCHAR(50)",
+            "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS end_time VARCHAR(50)",
+        ],
+    ),
+    (
+        "0003_hot_path_indexes",
+        [
+            # Balancing/reconciliation: completed non-dev assignments by condition
+            "CREATE INDEX IF NOT EXISTS ix_assignments_completed_condition "
+            "ON assignments (condition_id) "
+            "WHERE completed = true AND participant_id NOT LIKE 'DEV_%'",
+            # Per-participant lookups (summary aggregate, trial replay)
+            "CREATE INDEX IF NOT EXISTS ix_trials_participant_trial "
+            "ON trials (participant_id, trial_number)",
+            "CREATE INDEX IF NOT EXISTS ix_post_surveys_participant_id "
+            "ON post_surveys (participant_id)",
+            "CREATE INDEX IF NOT EXISTS ix_summaries_participant_id "
+            "ON summaries (participant_id)",
+        ],
+    ),
+    (
+        "0004_drop_completed_condition_index",
+        [
+            # Balancing reads condition_counters now; the partial index only cost
+            # a write on every assignment update
+            "DROP INDEX IF EXISTS ix_assignments_completed_condition",
+        ],
+    ),
+]
+
+
+def applied_migrations(conn):
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version VARCHAR(100) PRIMARY KEY, applied_at VARCHAR(50) NOT NULL)"
+        )
+    )
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """Apply pending migrations. Returns the versions applied by this call."""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        done = applied_migrations(conn)
+        for version, statements in MIGRATIONS:
+            if version in done:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, applied_at) VALUES (:v, :t)"),
+                {"v": version, "t": datetime.now().isoformat()},
+            )
+            applied_now.append(version)
+    return applied_now
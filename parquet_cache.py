@@ -0,0 +1,274 @@
+"""
+Parquet cache for the analysis scripts (optional: needs pyarrow).
+
+JsonlCache keeps the parsed records of a JSONL data directory under
+<data_dir>/.parquet_cache/: one Parquet part per record_type per refresh, plus
+manifest.json mapping each source file (path relative to the data directory)
+to its size, mtime, the byte offset parsed so far and the parts holding its
+rows. A refresh only parses files that are new or changed; JSONL files are
+append-only, so a file that grew is parsed from the cached offset onwards. A
+file that shrank is parsed again from the start and its old rows are
+dropped. Once more than COMPACT_PARTS parts are live, all live rows are
+rewritten into a single part.
+
+cached_table() caches one whole CSV/JSON export file the same way, keyed by
+path, size and mtime.
+
+Nested values (lists, dicts) and columns mixing value types are stored as
+JSON text and decoded again on read, so a cached load returns the same
+values as a direct parse. Delete the cache directory at any time to force a full reparse.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CACHE_DIR_NAME = ".parquet_cache"
+MANIFEST_NAME = "manifest.json"
+SOURCE_COLUMN = "_source"
+JSON_COLUMNS_KEY = b"json_columns"
+COMPACT_PARTS = 32
+CACHE_VERSION = 3
+
+
+def available():
+    return pq is not None
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _to_arrow(df):
+    """Arrow table for a frame; object columns pyarrow can't type become JSON text.
+
+    That includes object columns of ints: pandas only leaves ints as object
+    when they don't fit int64/uint64 (or sit next to None), and pyarrow would
+    either overflow or read them back as float.
+
+    The encoded column names go in the schema metadata so _read_parquet() can
+    decode them again.
+    """
+    df = df.copy()
+    encoded = []
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].tolist()
+        kinds = {type(v) for v in values if v is not None and v == v}
+        if len(kinds) > 1 or kinds & {dict, list, int}:
+            df[col] = [None if v is None else json.dumps(v) for v in values]
+            encoded.append(col)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), JSON_COLUMNS_KEY: json.dumps(encoded).encode("utf-8")}
+    return table.replace_schema_metadata(metadata)
+
+
+def _read_parquet(path, columns=None):
+    """DataFrame from a file written by _to_arrow(), with JSON-encoded columns decoded."""
+    table = pq.read_table(path, columns=columns)
+    df = table.to_pandas()
+    encoded = json.loads((table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b"[]"))
+    for col in encoded:
+        if col in df.columns:
+            # One json.loads over the whole column instead of one call per value
+            texts = [v if isinstance(v, str) else "null" for v in df[col].tolist()]
+            df[col] = pd.Series(json.loads("[" + ",".join(texts) + "]"), index=df.index, dtype=object)
+    return df
+
+
+def _write_parquet(df, path):
+    tmp = path + ".tmp"
+    pq.write_table(_to_arrow(df), tmp)
+    os.replace(tmp, path)
+
+
+class JsonlCache:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, CACHE_DIR_NAME)
+        self._prefix = os.path.join(data_dir, "")
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {"version": CACHE_VERSION, "next_part": 1, "sources": {}, "part_sources": {}}
+
+    def _save_manifest(self):
+        path = os.path.join(self.root, MANIFEST_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            # dumps() uses the C encoder; dump() streams through the pure-Python one
+            f.write(json.dumps(self.manifest, separators=(",", ":")))
+        os.replace(tmp, path)
+
+    def _part_path(self, record_type, part):
+        return os.path.join(self.root, str(record_type), f"part-{part:06d}.parquet")
+
+    def _rel(self, path):
+        """Source path relative to the data directory (paths come from jsonl_paths())."""
+        if path.startswith(self._prefix):
+            return path[len(self._prefix):]
+        return os.path.relpath(path, self.data_dir)
+
+    def _live_parts(self):
+        return sorted({p for entry in self.manifest["sources"].values() for p in entry["parts"]})
+
+    def refresh(self, paths, parse):
+        """Bring the cache up to date with ``paths``; returns how many files were parsed.
+
+        ``parse(tasks)`` gets a list of (path, start_offset) and returns
+        (frames, ends): one DataFrame per record_type with a SOURCE_COLUMN of
+        source paths, and the byte offset each file was parsed up to.
+        """
+        sources = self.manifest["sources"]
+        rel_paths = {self._rel(path): path for path in paths}
+        removed = set(sources) - set(rel_paths)
+        for rel in removed:
+            del sources[rel]
+
+        tasks = []
+        for rel, path in rel_paths.items():
+            size, mtime_ns = _stat_key(path)
+            entry = sources.get(rel)
+            if entry and (entry["size"], entry["mtime_ns"]) == (size, mtime_ns):
+                continue
+            if not entry or size < entry["offset"]:
+                entry = sources[rel] = {"size": size, "mtime_ns": mtime_ns, "offset": 0, "parts": []}
+            entry["size"], entry["mtime_ns"] = size, mtime_ns
+            tasks.append((path, entry["offset"]))
+
+        if tasks:
+            frames, ends = parse(tasks)
+            part = self.manifest["next_part"]
+            self.manifest["next_part"] = part + 1
+            written = set()
+            for record_type, df in frames.items():
+                if df.empty:
+                    continue
+                rel_names = {p: self._rel(p) for p in df[SOURCE_COLUMN].unique()}
+                df[SOURCE_COLUMN] = df[SOURCE_COLUMN].map(rel_names)
+                os.makedirs(os.path.dirname(self._part_path(record_type, part)), exist_ok=True)
+                _write_parquet(df, self._part_path(record_type, part))
+                written.update(df[SOURCE_COLUMN].unique())
+            for path, end in ends.items():
+                rel = self._rel(path)
+                sources[rel]["offset"] = end
+                if rel in written:
+                    sources[rel]["parts"].append(part)
+            # Number of sources written; fewer holders later means some rows are stale
+            self.manifest["part_sources"][str(part)] = len(written)
+
+        if not tasks and not removed and os.path.exists(os.path.join(self.root, MANIFEST_NAME)):
+            return 0
+        if len(self._live_parts()) > COMPACT_PARTS:
+            self._compact()
+        live = set(self._live_parts())
+        self.manifest["part_sources"] = {
+            p: n for p, n in self.manifest["part_sources"].items() if int(p) in live
+        }
+        # Manifest first: parts are only deleted once nothing on disk refers to them
+        os.makedirs(self.root, exist_ok=True)
+        self._save_manifest()
+        self._remove_dead_parts()
+        return len(tasks)
+
+    def _compact(self):
+        frames = self.read(keep_source=True)
+        part = self.manifest["next_part"]
+        self.manifest["next_part"] = part + 1
+        for record_type, df in frames.items():
+            os.makedirs(os.path.dirname(self._part_path(record_type, part)), exist_ok=True)
+            _write_parquet(df, self._part_path(record_type, part))
+        holders = [entry for entry in self.manifest["sources"].values() if entry["parts"]]
+        for entry in holders:
+            entry["parts"] = [part]
+        self.manifest["part_sources"][str(part)] = len(holders)
+
+    def _record_types(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _remove_dead_parts(self):
+        live = set(self._live_parts())
+        for record_type in self._record_types():
+            type_dir = os.path.join(self.root, record_type)
+            for name in os.listdir(type_dir):
+                if not name.endswith(".parquet") or int(name[5:11]) not in live:
+                    os.remove(os.path.join(type_dir, name))
+
+    def read(self, columns=None, keep_source=False):
+        """One DataFrame per cached record_type, limited to ``columns[record_type]`` if given."""
+        # Which sources each part still holds current rows for
+        holders = {}
+        for rel, entry in self.manifest["sources"].items():
+            for part in entry["parts"]:
+                holders.setdefault(part, set()).add(rel)
+
+        frames = {}
+        for record_type in self._record_types():
+            wanted = (columns or {}).get(record_type)
+            pieces = []
+            for part in sorted(holders):
+                path = self._part_path(record_type, part)
+                if not os.path.exists(path):
+                    continue
+                names = pq.read_schema(path).names
+                read_cols = None
+                if wanted is not None:
+                    read_cols = [c for c in wanted if c in names] + [SOURCE_COLUMN]
+                df = _read_parquet(path, read_cols)
+                if len(holders[part]) < self.manifest["part_sources"].get(str(part), 0):
+                    df = df[df[SOURCE_COLUMN].isin(holders[part])]
+                pieces.append(df)
+            if not pieces:
+                continue
+            df = pd.concat(pieces, ignore_index=True, sort=False) if len(pieces) > 1 else pieces[0]
+            if not keep_source:
+                df = df.drop(columns=[SOURCE_COLUMN])
+            frames[record_type] = df.reset_index(drop=True)
+        return frames
+
+
+def cached_table(path, load, columns=None):
+    """DataFrame for one export file, from the cache when path, size and mtime match.
+
+    ``load(path)`` builds the frame on a miss; ``columns`` limits what is read.
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(path)}-{digest}.parquet")
+    key = json.dumps([CACHE_VERSION, *_stat_key(path)]).encode("utf-8")
+
+    if os.path.exists(cache_path):
+        schema = pq.read_schema(cache_path)
+        if (schema.metadata or {}).get(b"source_key") == key:
+            read_cols = None if columns is None else [c for c in columns if c in schema.names]
+            return _read_parquet(cache_path, read_cols)
+
+    df = load(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    table = _to_arrow(df)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"source_key": key})
+    tmp = cache_path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, cache_path)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
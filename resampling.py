@@ -0,0 +1,413 @@
+"""
+Bootstrap and permutation engine for the analysis scripts.
+
+moderated_mediation() estimates the PROCESS Model 8 moderated mediation
+
+  M = a0 + a1*X + a2*W + a3*X*W
+  Y = c0 + c1*X + c2*W + c3*X*W + b*M
+
+with X = loss_frame (1 = near_miss), W = frame_type (1 = skill). The
+conditional indirect effect of X at W = w is (a1 + a3*w) * b and the index of
+moderated mediation is a3 * b; their CIs come from a nonparametric bootstrap
+(percentile and BCa).
+
+Both regressions only need the Gram matrix of [1, X, W, XW, M, Y]. Each
+bootstrap block draws resample index arrays, turns them into per-row counts
+and gets every resample's Gram matrix from one matrix product with the
+per-row outer products; the coefficients then come from batched
+np.linalg.solve calls. Blocks run in a process pool, each with its own child
+of a numpy SeedSequence, so a seed gives the same draws for any worker count.
+
+permutation_test() one-hot encodes the integer condition codes once, shuffles
+y in (P, n) blocks against them and gets every permutation's per-label sums
+from one matrix product, so a statistic such as anova_2x2_f() or welch_t()
+is evaluated for the whole block at once. It stops early once the p-values
+are pinned down.
+bootstrap_cell_means() resamples within each cell for CIs on the cell means
+and contrasts between them.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import stats
+
+# Resamples per pool task (each task gets its own SeedSequence child)
+BOOT_TASK_SIZE = 1000
+# Upper bound on resamples x rows held as counts at once (~32 MB of float64)
+BOOT_BLOCK_CELLS = 4_000_000
+DEFAULT_RESAMPLES = 10000
+DEFAULT_SEED = 20240601
+
+# Permutations per pool task, and tasks per early-stopping round
+PERM_TASK_SIZE = 2000
+PERM_ROUND_TASKS = 4
+DEFAULT_PERMUTATIONS = 100000
+DEFAULT_PERM_TOLERANCE = 0.01
+PERM_CI_LEVEL = 0.99
+
+# Column order of the design [1, X, W, XW, M, Y]
+_K = 6
+_M_COLS = 4  # 1, X, W, XW
+_Y_COLS = 5  # 1, X, W, XW, M
+
+MEDIATION_ESTIMATES = [
+    "a1",
+    "a3",
+    "b",
+    "indirect_luck",
+    "indirect_skill",
+    "index_mod_med",
+    "direct_luck",
+    "direct_skill",
+]
+
+
+def _outer_rows(x: np.ndarray, w: np.ndarray, m: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """(n, 36) per-row outer products of [1, X, W, XW, M, Y]."""
+    design = np.column_stack([np.ones_like(x), x, w, x * w, m, y])
+    return (design[:, :, None] * design[:, None, :]).reshape(len(x), _K * _K)
+
+
+def _estimates(gram: np.ndarray) -> np.ndarray:
+    """Model 8 estimates (MEDIATION_ESTIMATES order) for a stack of (B, 6, 6) Gram matrices.
+
+    Resamples with an empty X/W cell, or where M is collinear with the cells,
+    come back as NaN rows.
+    """
+    gram = gram.copy()
+    n11 = gram[:, 3, 3]
+    n10 = gram[:, 1, 1] - n11
+    n01 = gram[:, 2, 2] - n11
+    n00 = gram[:, 0, 0] - gram[:, 1, 1] - gram[:, 2, 2] + n11
+    valid = np.minimum.reduce([n00, n01, n10, n11]) >= 1
+    valid &= np.linalg.slogdet(np.where(valid[:, None, None], gram, np.eye(_K))[:, :_Y_COLS, :_Y_COLS])[0] > 0
+    gram[~valid] = np.eye(_K)
+
+    a = np.linalg.solve(gram[:, :_M_COLS, :_M_COLS], gram[:, :_M_COLS, 4:5])[..., 0]
+    c = np.linalg.solve(gram[:, :_Y_COLS, :_Y_COLS], gram[:, :_Y_COLS, 5:6])[..., 0]
+    a1, a3 = a[:, 1], a[:, 3]
+    c1, c3, b = c[:, 1], c[:, 3], c[:, 4]
+    out = np.column_stack([a1, a3, b, a1 * b, (a1 + a3) * b, a3 * b, c1, c1 + c3])
+    out[~valid] = np.nan
+    return out
+
+
+def _bootstrap_task(args: Tuple[np.ndarray, int, np.random.SeedSequence]) -> np.ndarray:
+    """Pool task: estimates for ``size`` resamples of the rows behind ``outer``."""
+    outer, size, seed = args
+    n = len(outer)
+    rng = np.random.default_rng(seed)
+    block = max(1, min(size, BOOT_BLOCK_CELLS // n))
+    offsets = (np.arange(block) * n)[:, None]
+    results = []
+    for start in range(0, size, block):
+        rows = min(block, size - start)
+        idx = rng.integers(0, n, size=(rows, n))
+        counts = np.bincount((idx + offsets[:rows]).ravel(), minlength=rows * n)
+        gram = (counts.reshape(rows, n).astype(np.float64) @ outer).reshape(rows, _K, _K)
+        results.append(_estimates(gram))
+    return np.vstack(results)
+
+
+@contextmanager
+def _pool(workers: int | None, tasks: int):
+    """Process pool for up to ``tasks`` tasks, or None to run them inline."""
+    workers = min(workers or os.cpu_count() or 1, tasks)
+    if workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield pool
+
+
+def _map(pool: ProcessPoolExecutor | None, fn, tasks: List) -> List:
+    return list(pool.map(fn, tasks)) if pool else [fn(task) for task in tasks]
+
+
+def bootstrap_estimates(
+    outer: np.ndarray,
+    resamples: int,
+    seed: int | None = DEFAULT_SEED,
+    workers: int | None = None,
+) -> np.ndarray:
+    """(resamples, len(MEDIATION_ESTIMATES)) bootstrap estimates, split into pool tasks."""
+    sizes = [min(BOOT_TASK_SIZE, resamples - i) for i in range(0, resamples, BOOT_TASK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(outer, size, child) for size, child in zip(sizes, seeds)]
+    with _pool(workers, len(tasks)) as pool:
+        return np.vstack(_map(pool, _bootstrap_task, tasks))
+
+
+def percentile_ci(boot: np.ndarray, level: float = 0.95) -> np.ndarray:
+    """(k, 2) percentile intervals for each column of ``boot`` (NaN rows ignored)."""
+    alpha = (1 - level) / 2
+    return np.nanquantile(boot, [alpha, 1 - alpha], axis=0).T
+
+
+def bca_ci(boot: np.ndarray, estimate: np.ndarray, jackknife: np.ndarray, level: float = 0.95) -> np.ndarray:
+    """(k, 2) bias-corrected and accelerated intervals for each column of ``boot``."""
+    alpha = (1 - level) / 2
+    out = np.full((boot.shape[1], 2), np.nan)
+    for j in range(boot.shape[1]):
+        values = boot[:, j][~np.isnan(boot[:, j])]
+        jack = jackknife[:, j][~np.isnan(jackknife[:, j])]
+        if len(values) == 0 or np.isnan(estimate[j]):
+            continue
+        # Ties count half, so a discrete statistic isn't biased one way
+        below = (np.sum(values < estimate[j]) + 0.5 * np.sum(values == estimate[j])) / len(values)
+        z0 = stats.norm.ppf(np.clip(below, 1 / (len(values) + 1), len(values) / (len(values) + 1)))
+        diff = jack.mean() - jack
+        denom = 6 * np.sum(diff ** 2) ** 1.5
+        accel = np.sum(diff ** 3) / denom if denom > 0 else 0.0
+        z = stats.norm.ppf([alpha, 1 - alpha])
+        adjusted = stats.norm.cdf(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+        if not np.isfinite(adjusted).all():
+            continue
+        out[j] = np.quantile(values, adjusted)
+    return out
+
+
+def _ols_table(gram: np.ndarray, n: int, cols: int, target: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Coefficients, standard errors and df_error of one regression from the full-sample Gram."""
+    xtx = gram[:cols, :cols]
+    xty = gram[:cols, target]
+    coef = np.linalg.solve(xtx, xty)
+    df_error = n - cols
+    rss = max(gram[target, target] - coef @ xty, 0.0)
+    se = np.sqrt(np.diag(np.linalg.inv(xtx)) * rss / df_error)
+    return coef, se, df_error
+
+
+def moderated_mediation(
+    x: np.ndarray,
+    w: np.ndarray,
+    m: np.ndarray,
+    y: np.ndarray,
+    resamples: int = DEFAULT_RESAMPLES,
+    seed: int | None = DEFAULT_SEED,
+    workers: int | None = None,
+    level: float = 0.95,
+) -> Dict:
+    """PROCESS Model 8 on 0/1-coded x (loss_frame) and w (frame_type).
+
+    Returns the path coefficients with OLS t tests, the conditional direct and
+    indirect effects at w = 0 (luck) and w = 1 (skill) and the index of
+    moderated mediation, each with percentile and BCa bootstrap CIs. Returns
+    {} when a cell is empty or there are too few rows to fit the models.
+    """
+    if resamples < 1:
+        raise ValueError(f"resamples must be at least 1, got {resamples}")
+    x, w, m, y = (np.asarray(v, dtype=np.float64) for v in (x, w, m, y))
+    n = len(x)
+    outer = _outer_rows(x, w, m, y)
+    gram = outer.sum(axis=0).reshape(_K, _K)
+    estimate = _estimates(gram[None])[0]
+    if n <= _Y_COLS or np.isnan(estimate).any():
+        return {}
+
+    paths: Dict[str, Dict] = {}
+    names = ["constant", "X", "W", "XW", "M"]
+    for model, cols, target in (("mediator", _M_COLS, 4), ("outcome", _Y_COLS, 5)):
+        coef, se, df_error = _ols_table(gram, n, cols, target)
+        t = coef / se
+        p = 2 * stats.t.sf(np.abs(t), df_error)
+        paths[model] = {
+            name: {"coef": float(coef[i]), "se": float(se[i]), "t": float(t[i]), "p": float(p[i])}
+            for i, name in enumerate(names[:cols])
+        }
+
+    boot = bootstrap_estimates(outer, resamples, seed=seed, workers=workers)
+    # Leave-one-out Gram matrices for the BCa acceleration
+    jackknife = _estimates((gram.ravel() - outer).reshape(n, _K, _K))
+    pct = percentile_ci(boot, level)
+    bca = bca_ci(boot, estimate, jackknife, level)
+
+    effects = {}
+    for j, name in enumerate(MEDIATION_ESTIMATES):
+        values = boot[:, j][~np.isnan(boot[:, j])]
+        effects[name] = {
+            "estimate": float(estimate[j]),
+            "boot_se": float(np.std(values, ddof=1)) if len(values) > 1 else float("nan"),
+            "percentile_ci": (float(pct[j, 0]), float(pct[j, 1])),
+            "bca_ci": (float(bca[j, 0]), float(bca[j, 1])),
+        }
+    return {
+        "n": n,
+        "resamples": resamples,
+        "valid_resamples": int(np.sum(~np.isnan(boot).any(axis=1))),
+        "level": level,
+        "seed": seed,
+        "paths": paths,
+        "effects": effects,
+    }
+
+
+def ci_excludes_zero(ci: Tuple[float, float] | List[float]) -> bool:
+    return bool(ci[0] > 0 or ci[1] < 0)
+
+
+def anova_2x2_f(cell_sum: np.ndarray, cell_sq: np.ndarray, cell_n: np.ndarray) -> np.ndarray:
+    """(P, 3) F for frame_type, loss_frame and the interaction from (P, 4) cell sums.
+
+    Cells are coded 2*skill + near_miss (luck/clear_loss, luck/near_miss,
+    skill/clear_loss, skill/near_miss); the sums of squares are the ones
+    analyze_data.compute_2x2_anova_batch() uses.
+    """
+    n_total = cell_n.sum()
+    grand_mean = cell_sum.sum(axis=1, keepdims=True) / n_total
+    ss_total = cell_sq.sum(axis=1) - n_total * grand_mean[:, 0] ** 2
+
+    def main_effect_ss(levels: List[List[int]]) -> np.ndarray:
+        ss = 0.0
+        for cells in levels:
+            level_n = cell_n[cells].sum()
+            level_mean = cell_sum[:, cells].sum(axis=1) / level_n
+            ss = ss + level_n * (level_mean - grand_mean[:, 0]) ** 2
+        return ss
+
+    ss_frame = main_effect_ss([[2, 3], [0, 1]])
+    ss_loss = main_effect_ss([[1, 3], [0, 2]])
+    ss_cells = (cell_n * (cell_sum / cell_n - grand_mean) ** 2).sum(axis=1)
+    ss_interaction = ss_cells - ss_frame - ss_loss
+    ms_error = np.maximum(ss_total - ss_cells, 0.001) / (n_total - 4)
+    return np.column_stack([ss_frame, ss_loss, ss_interaction]) / ms_error[:, None]
+
+
+def welch_t(cell_sum: np.ndarray, cell_sq: np.ndarray, cell_n: np.ndarray) -> np.ndarray:
+    """(P, 1) absolute Welch t between code 1 and code 0 from (P, 2) group sums."""
+    mean = cell_sum / cell_n
+    var = (cell_sq - cell_n * mean ** 2) / (cell_n - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = (mean[:, 1] - mean[:, 0]) / np.sqrt((var / cell_n).sum(axis=1))
+    return np.abs(t)[:, None]
+
+
+def _cell_sums(y: np.ndarray, onehot: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(P, n_codes) sums of y and y**2 per label for a (P, n) block of y orderings."""
+    return y @ onehot, (y * y) @ onehot
+
+
+def _permutation_task(args: Tuple) -> np.ndarray:
+    """Pool task: how many of ``size`` label permutations reach each observed statistic."""
+    onehot, y, statistic, observed, size, seed = args
+    rng = np.random.default_rng(seed)
+    cell_n = onehot.sum(axis=0)
+    block = max(1, min(size, BOOT_BLOCK_CELLS // len(y)))
+    tiled = np.tile(y, (block, 1))
+    hits = np.zeros(len(observed), dtype=np.int64)
+    for start in range(0, size, block):
+        rows = min(block, size - start)
+        # Shuffling y against fixed labels is the same as shuffling the labels
+        shuffled = rng.permuted(tiled[:rows], axis=1)
+        cell_sum, cell_sq = _cell_sums(shuffled, onehot)
+        values = statistic(cell_sum, cell_sq, cell_n)
+        # Relative slack so permutations tying the observed value count as hits
+        hits += (values >= observed * (1 - 1e-9)).sum(axis=0)
+    return hits
+
+
+def wilson_ci(hits: np.ndarray, total: int, level: float = PERM_CI_LEVEL) -> np.ndarray:
+    """(k, 2) Wilson score intervals for hit proportions."""
+    z = stats.norm.ppf(0.5 + level / 2)
+    p = hits / total
+    centre = (p + z ** 2 / (2 * total)) / (1 + z ** 2 / total)
+    half = z * np.sqrt(p * (1 - p) / total + z ** 2 / (4 * total ** 2)) / (1 + z ** 2 / total)
+    return np.column_stack([centre - half, centre + half])
+
+
+def permutation_test(
+    codes: np.ndarray,
+    y: np.ndarray,
+    n_codes: int,
+    statistic,
+    max_permutations: int = DEFAULT_PERMUTATIONS,
+    tolerance: float = DEFAULT_PERM_TOLERANCE,
+    seed: int | None = DEFAULT_SEED,
+    workers: int | None = None,
+) -> Dict:
+    """Permutation p-values for ``statistic`` over shuffled integer labels ``codes``.
+
+    ``statistic(cell_sum, cell_sq, cell_n)`` maps (P, n_codes) per-label sums
+    of y and y**2 to (P, m) statistics, larger meaning more extreme. Labels
+    are permuted in rounds of PERM_ROUND_TASKS pool tasks; sampling stops
+    once every p-value's PERM_CI_LEVEL Wilson interval is narrower than 2 * tolerance,
+    or after max_permutations. Statistics that are undefined for the data
+    (NaN, e.g. a group without variance) get a NaN p. Rounds don't depend on the worker count, so a
+    seed gives the same p-values on any machine.
+    """
+    if max_permutations < 1:
+        raise ValueError(f"max_permutations must be at least 1, got {max_permutations}")
+    if not tolerance > 0:
+        raise ValueError(f"tolerance must be greater than 0, got {tolerance}")
+    codes = np.asarray(codes, dtype=np.intp)
+    y = np.asarray(y, dtype=np.float64)
+    onehot = (codes[:, None] == np.arange(n_codes)).astype(np.float64)
+    observed_sum, observed_sq = _cell_sums(y[None], onehot)
+    observed = statistic(observed_sum, observed_sq, onehot.sum(axis=0))[0]
+    defined = np.isfinite(observed)
+
+    seed_seq = np.random.SeedSequence(seed)
+    hits = np.zeros(len(observed), dtype=np.int64)
+    done = 0
+    with _pool(workers, PERM_ROUND_TASKS) as pool:
+        while done < max_permutations:
+            sizes = []
+            for _ in range(PERM_ROUND_TASKS):
+                size = min(PERM_TASK_SIZE, max_permutations - done - sum(sizes))
+                if size > 0:
+                    sizes.append(size)
+            children = seed_seq.spawn(len(sizes))
+            tasks = [(onehot, y, statistic, observed, size, child) for size, child in zip(sizes, children)]
+            hits += np.sum(_map(pool, _permutation_task, tasks), axis=0)
+            done += sum(sizes)
+            ci = wilson_ci(hits, done)[defined]
+            if np.all(ci[:, 1] - ci[:, 0] <= 2 * tolerance):
+                break
+
+    return {
+        "observed": observed,
+        # +1 counts the observed labelling, so p is never 0
+        "p": np.where(defined, (hits + 1) / (done + 1), np.nan),
+        "p_ci": np.where(defined[:, None], wilson_ci(hits, done), np.nan),
+        "permutations": done,
+        "stopped_early": done < max_permutations,
+    }
+
+
+def _cell_bootstrap_task(args: Tuple) -> np.ndarray:
+    """Pool task: (size, n_codes) cell means, resampling rows within each cell."""
+    groups, size, seed = args
+    rng = np.random.default_rng(seed)
+    means = np.empty((size, len(groups)))
+    for c, values in enumerate(groups):
+        block = max(1, min(size, BOOT_BLOCK_CELLS // max(len(values), 1)))
+        for start in range(0, size, block):
+            rows = min(block, size - start)
+            idx = rng.integers(0, len(values), size=(rows, len(values)))
+            means[start:start + rows, c] = values[idx].mean(axis=1)
+    return means
+
+
+def bootstrap_cell_means(
+    codes: np.ndarray,
+    y: np.ndarray,
+    n_codes: int,
+    resamples: int = DEFAULT_RESAMPLES,
+    seed: int | None = DEFAULT_SEED,
+    workers: int | None = None,
+) -> np.ndarray:
+    """(resamples, n_codes) bootstrap cell means, stratified so each cell keeps its n."""
+    codes = np.asarray(codes, dtype=np.intp)
+    y = np.asarray(y, dtype=np.float64)
+    groups = [y[codes == c] for c in range(n_codes)]
+    sizes = [min(BOOT_TASK_SIZE, resamples - i) for i in range(0, resamples, BOOT_TASK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(groups, size, child) for size, child in zip(sizes, seeds)]
+    with _pool(workers, len(tasks)) as pool:
+        return np.vstack(_map(pool, _cell_bootstrap_task, tasks))
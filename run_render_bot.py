@@ -55,7 +55,8 @@ def run_one_session(base_url, force_condition=None, dev_mode=True):
         start_payload["force_loss_frame"] = loss_frame
 
     start = post_json(opener, base_url, "/api/start-session", start_payload)
-    _ = get_json(opener, base_url, "/api/get-frame")
+    if "frame" not in start:
+        _ = get_json(opener, base_url, "/api/get-frame")
 
     frame_type = start["frame_type"]
     max_trials = int(start.get("max_trials", 5))
@@ -63,13 +64,24 @@ def run_one_session(base_url, force_condition=None, dev_mode=True):
     reel_hit_used = False
     loss_frame = start["loss_frame"]
 
+    schedule = start.get("trial_schedule")
+
     for trial_number in range(1, max_trials + 1):
-        trial_config = post_json(
-            opener,
-            base_url,
-            "/api/generate-bar-trial",
-            {"trial_number": trial_number},
-        )
+        if schedule:
+            # Same parameters the server recomputes; no generate round trip
+            zone_start, bar_speed = schedule[trial_number - 1]
+            trial_config = {
+                "target_zone_start": zone_start,
+                "target_zone_width": start["target_zone_width"],
+                "bar_speed": bar_speed,
+            }
+        else:
+            trial_config = post_json(
+                opener,
+                base_url,
+                "/api/generate-bar-trial",
+                {"trial_number": trial_number},
+            )
 
         if frame_type == "skill":
             # Random stop position in the valid 0-100-ish range.
@@ -138,7 +150,7 @@ def run_one_session(base_url, force_condition=None, dev_mode=True):
         "luck_vs_skill": random.randint(1, 7),
     }
     _ = post_json(opener, base_url, "/api/save-post-survey", survey_payload)
-    summary = get_json(opener, base_url, "/api/get-summary")
+    summary = get_json(opener, base_url, "/api/get-summary?view=lean")
     return summary.get("participant_id"), summary.get("condition_id")
 
 
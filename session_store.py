@@ -0,0 +1,201 @@
+"""
+Server-side Flask sessions.
+
+The cookie only carries an opaque random session id; the session dict
+(including the growing per-participant trial list) is serialized as compact
+JSON and kept in one of these backends:
+
+  MemoryStore    in-process LRU (single worker, lost on restart)
+  SQLiteStore    local SQLite file in WAL mode (shared by workers on one host)
+  PostgresStore  table in the experiment database (shared by all hosts)
+"""
+
+import itertools
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Expired rows are purged on roughly one in this many writes
+PURGE_EVERY = 200
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemoryStore:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._items.get(sid)
+            if item is None:
+                return None
+            data, expires = item
+            if expires < time.time():
+                del self._items[sid]
+                return None
+            self._items.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._items[sid] = (data, time.time() + ttl)
+            self._items.move_to_end(sid)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # next() on a count is atomic, unlike += from concurrent threads
+        self._writes = itertools.count(1)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _conn(self):
+        # sqlite3 connections can't cross threads or forks; keep one per thread per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data, ttl):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+            (sid, data, time.time() + ttl),
+        )
+        if next(self._writes) % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+
+class PostgresStore:
+    def __init__(self, engine, table="flask_sessions"):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.table = table
+        self._writes = itertools.count(1)
+        self._get = text(f"SELECT data FROM {table} WHERE sid = :sid AND expires >= :now")
+        self._set = text(
+            f"INSERT INTO {table} (sid, data, expires) VALUES (:sid, :data, :expires) "
+            "ON CONFLICT (sid) DO UPDATE SET data = EXCLUDED.data, expires = EXCLUDED.expires"
+        )
+        self._delete = text(f"DELETE FROM {table} WHERE sid = :sid")
+        self._purge = text(f"DELETE FROM {table} WHERE expires < :now")
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    "(sid VARCHAR(64) PRIMARY KEY, data TEXT NOT NULL, expires DOUBLE PRECISION NOT NULL)"
+                )
+            )
+
+    def get(self, sid):
+        with self.engine.connect() as conn:
+            return conn.execute(self._get, {"sid": sid, "now": time.time()}).scalar()
+
+    def set(self, sid, data, ttl):
+        purge = next(self._writes) % PURGE_EVERY == 0
+        with self.engine.begin() as conn:
+            conn.execute(self._set, {"sid": sid, "data": data, "expires": time.time() + ttl})
+            if purge:
+                conn.execute(self._purge, {"now": time.time()})
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(self._delete, {"sid": sid})
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store, ttl=86400):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSideSession(json.loads(data), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        self.store.set(session.sid, dumps(dict(session)), self.ttl)
+        response.vary.add("Cookie")
+        if session.new or session.permanent:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
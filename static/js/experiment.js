@@ -113,6 +113,10 @@ async function startExperiment(forceFrameType = null, forceLossFrame = null) {
         experimentState.lossFrame = data.loss_frame;
         experimentState.conditionId = data.condition_id;
         experimentState.maxTrials = data.max_trials;
+        experimentState.trialSchedule = data.trial_schedule || null;
+        experimentState.targetZoneWidth = data.target_zone_width;
+        experimentState.barDuration = data.bar_duration;
+        experimentState.frame = data.frame || null;
         experimentState.currentTrial = 0;
         experimentState.completedTrials = 0;
 
@@ -124,8 +128,12 @@ async function startExperiment(forceFrameType = null, forceLossFrame = null) {
 }
 
 async function showFrameIntro() {
-    const response = await fetch('/api/get-frame');
-    const frame = await response.json();
+    // start-session inlines the frame; fetch it only from older servers
+    let frame = experimentState.frame;
+    if (!frame) {
+        const response = await fetch('/api/get-frame');
+        frame = await response.json();
+    }
     document.getElementById('frame-title').textContent = frame.title;
     document.getElementById('frame-description').textContent = frame.description;
     switchScreen('frame-intro-screen');
@@ -160,16 +168,34 @@ function showCountdown(callback) {
 
 // ─── TRIAL ROUTING ────────────────────────────────────────────────────────────
 
+// Trial config from the schedule sent by start-session: [[target_zone_start, bar_speed], ...]
+function scheduledTrialConfig(trialNumber) {
+    const entry = experimentState.trialSchedule && experimentState.trialSchedule[trialNumber - 1];
+    if (!entry) return null;
+    const width = experimentState.targetZoneWidth;
+    return {
+        trial_number: trialNumber,
+        target_zone_start: entry[0],
+        bar_speed: entry[1],
+        target_zone_width: width,
+        duration: experimentState.barDuration,
+        optimal_stop: entry[0] + width / 2
+    };
+}
+
 async function startNextTrial() {
     experimentState.currentTrial += 1;
 
     try {
-        const response = await fetch('/api/generate-bar-trial', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ trial_number: experimentState.currentTrial })
-        });
-        const config = await response.json();
+        let config = scheduledTrialConfig(experimentState.currentTrial);
+        if (!config) {
+            const response = await fetch('/api/generate-bar-trial', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ trial_number: experimentState.currentTrial })
+            });
+            config = await response.json();
+        }
         experimentState.currentTrialConfig = config;
 
         showCountdown(() => {
@@ -674,7 +700,7 @@ async function submitPostSurvey() {
 
 async function showSummary() {
     try {
-        await fetch('/api/get-summary');
+        await fetch('/api/get-summary?view=lean');
         switchScreen('summary-screen');
     } catch (error) {
         switchScreen('summary-screen');
@@ -0,0 +1,1070 @@
+"""
+Persistence backends for experiment records.
+
+  PostgresStorage  Flask-SQLAlchemy models from app.py (DATABASE_URL)
+  JsonlStorage     JSONL files under experiment_data/ (default without a database)
+  SQLiteStorage    local SQLite file in WAL mode (single-node deployments)
+  MemoryStorage    in-process tables (benchmarks, local experiments)
+
+Each backend provides three primitives:
+
+  insert_many(table, records)  batch insert; records are dicts keyed by column
+  scan(table, since=None)      stream rows as dicts, oldest first; since= keeps rows
+                               written (assignments: or completed) after it
+  count_by_condition()         non-dev {condition_id: (assigned, completed)}
+
+Each backend also provides the session operations the routes need:
+claim_condition, start_assignment and complete_session. Route handlers in
+app.py only use this interface. A backend can be tuned (batching, locking,
+indexes) without touching them.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+from jsonl_store import iter_jsonl_records
+
+# Column order per table (CSV exports, scans and inserts)
+EXPORT_FIELDS = {
+    "trials": [
+        "id",
+        "participant_id",
+        "timestamp",
+        "condition_id",
+        "frame_type",
+        "loss_frame",
+        "trial_number",
+        "bar_position",
+        "target_zone_start",
+        "target_zone_end",
+        "distance_from_center",
+        "true_outcome",
+        "framed_outcome",
+    ],
+    "post_surveys": [
+        "id",
+        "participant_id",
+        "timestamp",
+        "condition_id",
+        "frame_type",
+        "loss_frame",
+        "wants_more_rounds",
+        "desired_rounds_next_time",
+        "improvement_confidence",
+        "learning_potential",
+        "expected_success",
+        "app_download_likelihood",
+        "confidence_impact",
+        "feedback_credibility",
+        "self_rated_accuracy",
+        "final_round_closeness",
+        "frustration",
+        "motivation",
+        "luck_vs_skill",
+    ],
+    "summaries": [
+        "id",
+        "participant_id",
+        "timestamp",
+        "condition_id",
+        "frame_type",
+        "loss_frame",
+        "trial_count",
+        "hits",
+        "near_misses",
+        "losses",
+        "age",
+        "gender",
+        "bdm_course_member",
+    ],
+    "assignments": [
+        "id",
+        "participant_id",
+        "timestamp",
+        "start_time",
+        "end_time",
+        "condition_id",
+        "frame_type",
+        "loss_frame",
+        "is_dev",
+        "completed",
+    ],
+}
+
+# record_type of each table's rows in exports and JSONL files (export order)
+RECORD_TYPES = {
+    "assignments": "assignment",
+    "trials": "trial",
+    "post_surveys": "post_survey",
+    "summaries": "summary",
+}
+TABLES = {record_type: table for table, record_type in RECORD_TYPES.items()}
+
+BOOLEAN_FIELDS = {"wants_more_rounds", "bdm_course_member", "is_dev", "completed"}
+
+SCAN_BATCH_SIZE = 1000
+
+
+def columns(table):
+    """Insertable columns of a table (everything but id)."""
+    return [f for f in EXPORT_FIELDS[table] if f != "id"]
+
+
+def project(table, record):
+    return {f: record.get(f) for f in columns(table)}
+
+
+def is_dev_participant(participant_id):
+    return participant_id.startswith("DEV_")
+
+
+def changed_at(table, row):
+    """Timestamp that scan(since=...) compares against.
+
+    Assignment rows are updated again when the session completes, so they
+    use COALESCE(end_time, timestamp); incremental exports then pick up the
+    completion.
+    """
+    if table == "assignments":
+        return row.get("end_time") or row.get("timestamp") or ""
+    return row.get("timestamp") or ""
+
+
+def tally_outcomes(trials):
+    """(trial_count, hits, near_misses, losses) from trial dicts."""
+    outcomes = [t.get("framed_outcome") for t in trials]
+    return (
+        len(outcomes),
+        outcomes.count("hit"),
+        outcomes.count("near_miss"),
+        outcomes.count("loss"),
+    )
+
+
+class Storage:
+    def __init__(self, condition_ids):
+        self.condition_ids = list(condition_ids)
+
+    # Primitives
+
+    def insert(self, table, record):
+        self.insert_many(table, [record])
+
+    def insert_many(self, table, records):
+        raise NotImplementedError
+
+    def scan(self, table, since=None):
+        raise NotImplementedError
+
+    def count_by_condition(self):
+        raise NotImplementedError
+
+    # Session operations
+
+    def claim_condition(self, participant_id):
+        """Pick the condition with the fewest completions (random among ties)."""
+        counts = self.count_by_condition()
+        completed = {cid: counts[cid][1] for cid in self.condition_ids}
+        min_count = min(completed.values())
+        chosen = random.choice([c for c, n in completed.items() if n == min_count])
+        frame_type, loss_frame = chosen.split("_", 1)
+        return frame_type, loss_frame
+
+    def start_assignment(self, participant_id, frame_type, loss_frame, is_dev=False, claimed=False):
+        """Record a (re)started session. ``claimed`` means claim_condition() already counted it."""
+        raise NotImplementedError
+
+    def complete_session(self, participant_id, build_summary):
+        """Mark the session completed and store its summary.
+
+        ``build_summary(counts)`` returns the summary record; ``counts`` is
+        (trial_count, hits, near_misses, losses) from stored trials, or None
+        when this backend can't see every trial yet and the caller should
+        count from the session.
+        """
+        raise NotImplementedError
+
+    def export_records(self, since=None):
+        """Every stored record with its record_type, table by table."""
+        for table, record_type in RECORD_TYPES.items():
+            for row in self.scan(table, since):
+                del row["id"]
+                record = {"record_type": record_type}
+                record.update(row)
+                yield record
+
+    def prepare(self):
+        """Startup hook: bring derived balancing state up to date."""
+
+    def reconcile(self):
+        """Rebuild derived balancing state; returns count_by_condition()."""
+        return self.count_by_condition()
+
+    def close(self):
+        pass
+
+    def _empty_counts(self):
+        return {cid: (0, 0) for cid in self.condition_ids}
+
+
+class PostgresStorage(Storage):
+    """Rows in the Flask-SQLAlchemy tables; balancing via condition_counters.
+
+    With a WriteBehindQueue attached (``write_behind``), trial, survey and
+    summary inserts are queued and flushed in batches by flush().
+    """
+
+    WRITE_BEHIND_TABLES = ("trials", "post_surveys", "summaries")
+
+    def __init__(self, app, db, models, counter_model, condition_ids):
+        super().__init__(condition_ids)
+        self.app = app
+        self.db = db
+        self.models = models
+        self.counter_model = counter_model
+        self.write_behind = None
+
+    def insert_many(self, table, records):
+        from sqlalchemy import insert
+
+        rows = [project(table, r) for r in records]
+        if self.write_behind and table in self.WRITE_BEHIND_TABLES:
+            for row in rows:
+                self.write_behind.put(table, row)
+            return
+        # executemany on one insert() is sent as multi-row INSERT ... VALUES
+        self.db.session.execute(insert(self.models[table].__table__), rows)
+        self.db.session.commit()
+
+    def flush(self, batch):
+        """WriteBehindQueue callback: insert a batch of (table, row) in one transaction."""
+        from sqlalchemy import insert
+
+        rows_by_table = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        with self.app.app_context():
+            try:
+                for table, rows in rows_by_table.items():
+                    self.db.session.execute(insert(self.models[table].__table__), rows)
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def scan(self, table, since=None):
+        from sqlalchemy import func, select
+
+        model = self.models[table]
+        fields = EXPORT_FIELDS[table]
+        stmt = select(*[getattr(model, f) for f in fields]).order_by(model.id)
+        if since:
+            # Same rule as changed_at()
+            if table == "assignments":
+                stmt = stmt.where(func.coalesce(model.end_time, model.timestamp) > since)
+            else:
+                stmt = stmt.where(model.timestamp > since)
+        # yield_per streams rows through a server-side cursor instead of loading the table
+        stmt = stmt.execution_options(yield_per=SCAN_BATCH_SIZE)
+        for row in self.db.session.execute(stmt):
+            yield dict(zip(fields, row))
+
+    def count_by_condition(self):
+        counts = self._empty_counts()
+        for counter in self.counter_model.query.all():
+            if counter.condition_id in counts:
+                counts[counter.condition_id] = (counter.assigned, counter.completed)
+        return counts
+
+    def prepare(self):
+        with self.app.app_context():
+            if self.counter_model.query.count() < len(self.condition_ids):
+                self.reconcile()
+
+    def reconcile(self):
+        """Rebuild condition_counters from the assignments table."""
+        from sqlalchemy import func
+        from sqlalchemy.dialects.postgresql import insert
+
+        Assignment = self.models["assignments"]
+        rows = (
+            self.db.session.query(
+                Assignment.condition_id,
+                func.count(Assignment.id),
+                func.count(Assignment.id).filter(Assignment.completed == True),
+            )
+            .filter(~Assignment.participant_id.like("DEV_%"))
+            .group_by(Assignment.condition_id)
+            .all()
+        )
+        counts = self._empty_counts()
+        for condition_id, assigned, completed in rows:
+            if condition_id in counts:
+                counts[condition_id] = (assigned, completed)
+
+        stmt = insert(self.counter_model).values(
+            [
+                {"condition_id": cid, "assigned": assigned, "completed": completed}
+                for cid, (assigned, completed) in counts.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.counter_model.condition_id],
+            set_={"assigned": stmt.excluded.assigned, "completed": stmt.excluded.completed},
+        )
+        self.db.session.execute(stmt)
+        self.db.session.commit()
+        return counts
+
+    def claim_condition(self, participant_id):
+        """Pick the least-completed condition and count the assignment in one statement.
+
+        Concurrent starters lock only the counter row they pick; SKIP LOCKED
+        sends them to the next least-filled condition instead of waiting.
+        Runs in the caller's transaction (committed by start_assignment).
+        """
+        from sqlalchemy import text
+
+        claim_sql = (
+            "UPDATE condition_counters SET assigned = assigned + :increment "
+            "WHERE condition_id = ("
+            "  SELECT condition_id FROM condition_counters"
+            "  ORDER BY completed, random() LIMIT 1 FOR UPDATE{skip}"
+            ") RETURNING condition_id"
+        )
+        params = {"increment": 0 if is_dev_participant(participant_id) else 1}
+        session = self.db.session
+        condition_id = session.execute(text(claim_sql.format(skip=" SKIP LOCKED")), params).scalar()
+        if condition_id is None:
+            # Every counter row is locked by an in-flight start; wait for one
+            condition_id = session.execute(text(claim_sql.format(skip="")), params).scalar()
+        frame_type, loss_frame = condition_id.split("_", 1)
+        return frame_type, loss_frame
+
+    def start_assignment(self, participant_id, frame_type, loss_frame, is_dev=False, claimed=False):
+        Assignment = self.models["assignments"]
+        timestamp = datetime.now().isoformat()
+        condition_id = f"{frame_type}_{loss_frame}"
+        assignment = Assignment.query.filter_by(participant_id=participant_id).first()
+        if assignment is None:
+            assignment = Assignment(participant_id=participant_id)
+            self.db.session.add(assignment)
+        else:
+            # Re-used participant_id: move its counts off the previous condition
+            self._bump(
+                assignment.condition_id,
+                participant_id,
+                assigned=-1,
+                completed=-1 if assignment.completed else 0,
+            )
+        assignment.timestamp = timestamp
+        assignment.start_time = timestamp
+        assignment.end_time = None
+        assignment.condition_id = condition_id
+        assignment.frame_type = frame_type
+        assignment.loss_frame = loss_frame
+        assignment.is_dev = bool(is_dev)
+        assignment.completed = False
+        if not claimed:
+            self._bump(condition_id, participant_id, assigned=1)
+        self.db.session.commit()
+
+    def complete_session(self, participant_id, build_summary):
+        Assignment = self.models["assignments"]
+        assignment = Assignment.query.filter_by(participant_id=participant_id).first()
+        counts = None
+        if not self.write_behind:
+            # Rows may otherwise still be queued in another worker's buffer
+            counts = self._count_outcomes(participant_id, assignment.start_time if assignment else None)
+        summary = build_summary(counts)
+
+        # Completion, counter bump and summary row commit together
+        if assignment is not None:
+            if not assignment.completed:
+                self._bump(assignment.condition_id, participant_id, completed=1)
+            assignment.completed = True
+            assignment.end_time = datetime.now().isoformat()
+        self.db.session.add(self.models["summaries"](**project("summaries", summary)))
+        self.db.session.commit()
+        return summary
+
+    def _count_outcomes(self, participant_id, since=None):
+        """Trial count and framed-outcome counts for one participant in a single query."""
+        from sqlalchemy import func
+
+        Trial = self.models["trials"]
+        query = self.db.session.query(
+            func.count(Trial.id),
+            func.count(Trial.id).filter(Trial.framed_outcome == "hit"),
+            func.count(Trial.id).filter(Trial.framed_outcome == "near_miss"),
+            func.count(Trial.id).filter(Trial.framed_outcome == "loss"),
+        ).filter(Trial.participant_id == participant_id)
+        if since:
+            # Ignore trials left by an earlier session that reused this participant_id
+            query = query.filter(Trial.timestamp >= since)
+        return tuple(query.one())
+
+    def _bump(self, condition_id, participant_id, assigned=0, completed=0):
+        """Adjust a counter row inside the caller's transaction (no commit)."""
+        from sqlalchemy import text
+
+        if is_dev_participant(participant_id) or condition_id not in self.condition_ids:
+            return
+        self.db.session.execute(
+            text(
+                "UPDATE condition_counters "
+                "SET assigned = assigned + :assigned, completed = completed + :completed "
+                "WHERE condition_id = :condition_id"
+            ),
+            {"condition_id": condition_id, "assigned": assigned, "completed": completed},
+        )
+
+    def close(self):
+        if self.write_behind:
+            self.write_behind.close()
+
+
+class JsonlStorage(Storage):
+    """Append-only JSONL records, written through a JsonlAppender or SegmentedLog.
+
+    Balancing state is kept next to the files instead of re-parsing them:
+    - .assignment_log: append-only [participant_id, condition_id, completed] lines,
+      one per state change; the last line for a participant is its state
+    - .condition_counts: non-dev assigned/completed per condition plus the log
+      offset they reflect
+
+    Each process keeps the state in memory and only reads the log tail other
+    workers appended since its last look. The log append is the commit point:
+    counts behind the log (a crash between the two writes) are recomputed by
+    the next writer.
+    """
+
+    def __init__(self, data_dir, appender, condition_ids):
+        super().__init__(condition_ids)
+        self.data_dir = data_dir
+        self.appender = appender
+        self.log_path = os.path.join(data_dir, ".assignment_log")
+        self.counts_path = os.path.join(data_dir, ".condition_counts")
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def insert_many(self, table, records):
+        for record in records:
+            self.appender.append(record["participant_id"], record)
+
+    def scan(self, table, since=None):
+        # Files have no ids; number rows in scan order so CSV exports keep an id column
+        fields = EXPORT_FIELDS[table]
+        if table == "assignments":
+            rows = self._fold_assignments()
+        else:
+            record_type = RECORD_TYPES[table]
+            rows = (r for r in iter_jsonl_records(self.data_dir) if r.get("record_type") == record_type)
+        for row_id, record in enumerate(rows, start=1):
+            if since and changed_at(table, record) <= since:
+                continue
+            row = {f: record.get(f) for f in fields}
+            row["id"] = row_id
+            yield row
+
+    def export_records(self, since=None):
+        # Raw records in file order, including assignment_complete markers
+        for record in iter_jsonl_records(self.data_dir):
+            if since and (record.get("timestamp") or "") <= since:
+                continue
+            yield record
+
+    def count_by_condition(self):
+        with self._index_locked():
+            self._sync_log()
+            return self._counts()
+
+    def claim_condition(self, participant_id):
+        # Only completions matter for balancing; read the small counts file, not the log
+        stored = self._read_json(self.counts_path, {})
+        if stored.get("log_offset") != self._log_size():
+            stored = {"completed": {cid: n for cid, (_, n) in self.count_by_condition().items()}}
+        completed = {cid: _as_int(stored.get("completed", {}).get(cid)) for cid in self.condition_ids}
+        min_count = min(completed.values())
+        chosen = random.choice([c for c, n in completed.items() if n == min_count])
+        frame_type, loss_frame = chosen.split("_", 1)
+        return frame_type, loss_frame
+
+    def start_assignment(self, participant_id, frame_type, loss_frame, is_dev=False, claimed=False):
+        timestamp = datetime.now().isoformat()
+        condition_id = f"{frame_type}_{loss_frame}"
+        record = {
+            "record_type": "assignment",
+            "participant_id": participant_id,
+            "timestamp": timestamp,
+            "start_time": timestamp,
+            "end_time": None,
+            "condition_id": condition_id,
+            "frame_type": frame_type,
+            "loss_frame": loss_frame,
+            "is_dev": bool(is_dev),
+            "completed": False,
+        }
+        self.appender.append(participant_id, record)
+        self._update_state(participant_id, condition_id, completed=False)
+
+    def complete_session(self, participant_id, build_summary):
+        summary = build_summary(None)
+        end_time = datetime.now().isoformat()
+        assignment_complete = {
+            "record_type": "assignment_complete",
+            "participant_id": participant_id,
+            "timestamp": end_time,
+            "end_time": end_time,
+            "completed": True,
+        }
+        self.appender.append(participant_id, assignment_complete)
+        self._update_state(participant_id, completed=True)
+        self.appender.append(participant_id, summary)
+        return summary
+
+    def prepare(self):
+        # Full scan only on first start; reconcile-counters rebuilds on demand
+        if os.path.exists(self.log_path):
+            return
+        with self._index_locked():
+            if not os.path.exists(self.log_path):
+                self._rebuild_log()
+
+    def reconcile(self):
+        """Rebuild the participant state log and condition counts from the JSONL files."""
+        with self._index_locked():
+            self._rebuild_log()
+            return self._counts()
+
+    def close(self):
+        self.appender.close()
+
+    def _fold_assignments(self):
+        """One assignments row per participant, latest session wins."""
+        rows = {}
+        for record in iter_jsonl_records(self.data_dir):
+            record_type = record.get("record_type")
+            participant_id = record.get("participant_id")
+            if record_type == "assignment":
+                rows.pop(participant_id, None)
+                rows[participant_id] = dict(record)
+            elif record_type == "assignment_complete" and participant_id in rows:
+                rows[participant_id]["end_time"] = record.get("end_time")
+                rows[participant_id]["completed"] = True
+        return rows.values()
+
+    def _rebuild_log(self):
+        # Caller holds the index lock for the whole scan, so no _update_state is lost
+        state = {}
+        for record in iter_jsonl_records(self.data_dir):
+            participant_id = record.get("participant_id")
+            if record.get("record_type") == "assignment":
+                # A restarted session resets completion, same as the DB path
+                state[participant_id] = [record.get("condition_id"), False]
+            elif record.get("record_type") == "assignment_complete" and participant_id in state:
+                state[participant_id][1] = True
+
+        # Compacted log: one line per participant, swapped in whole
+        tmp_path = f"{self.log_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for participant_id, (condition_id, completed) in state.items():
+                f.write(json.dumps([participant_id, condition_id, completed]) + "\n")
+        os.replace(tmp_path, self.log_path)
+        self._reset_state()
+        self._sync_log()
+        self._write_counts()
+        # Pre-log index from older versions
+        if os.path.exists(os.path.join(self.data_dir, ".assignment_index")):
+            os.remove(os.path.join(self.data_dir, ".assignment_index"))
+
+    def _update_state(self, participant_id, condition_id=None, completed=False):
+        """Record a participant's condition and/or completion in the state log.
+
+        ``condition_id=None`` keeps the participant's existing condition (used
+        when marking completion). Appends one line and rewrites the small
+        counts file; nothing else is read beyond the log tail.
+        """
+        with self._index_locked():
+            self._sync_log()
+            old = self._state.get(participant_id)
+            if condition_id is None:
+                if old is None:
+                    return
+                condition_id = old[0]
+
+            line = (json.dumps([participant_id, condition_id, completed]) + "\n").encode("utf-8")
+            with open(self.log_path, "ab") as f:
+                f.write(line)
+                f.flush()
+                if self._log_inode is None:
+                    self._log_inode = os.fstat(f.fileno()).st_ino
+            self._log_offset += len(line)
+            self._apply(participant_id, condition_id, completed)
+            self._write_counts()
+
+    def _reset_state(self):
+        self._state = {}
+        self._assigned = {}
+        self._completed = {}
+        self._log_offset = 0
+        self._log_inode = None
+
+    def _apply(self, participant_id, condition_id, completed):
+        old = self._state.get(participant_id)
+        self._state[participant_id] = [condition_id, completed]
+        if is_dev_participant(participant_id):
+            return
+        if old is not None:
+            self._assigned[old[0]] = self._assigned.get(old[0], 0) - 1
+            if old[1]:
+                self._completed[old[0]] = self._completed.get(old[0], 0) - 1
+        self._assigned[condition_id] = self._assigned.get(condition_id, 0) + 1
+        if completed:
+            self._completed[condition_id] = self._completed.get(condition_id, 0) + 1
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    def _sync_log(self):
+        """Apply log lines appended since this process last looked (caller holds the lock)."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            self._reset_state()
+            return
+        if st.st_ino != self._log_inode or st.st_size < self._log_offset:
+            # Rebuilt by reconcile-counters: start over from the compacted log
+            self._reset_state()
+            self._log_inode = st.st_ino
+        if st.st_size == self._log_offset:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # Torn line from a crash mid-append; drop it so the next append starts clean
+            os.truncate(self.log_path, self._log_offset + end)
+        for line in data[:end].splitlines():
+            try:
+                participant_id, condition_id, completed = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(participant_id, condition_id, completed)
+        self._log_offset += end
+
+    def _counts(self):
+        return {
+            cid: (self._assigned.get(cid, 0), self._completed.get(cid, 0))
+            for cid in self.condition_ids
+        }
+
+    def _write_counts(self):
+        counts = self._counts()
+        self._write_json_atomic(
+            self.counts_path,
+            {
+                "log_offset": self._log_offset,
+                "assigned": {cid: n for cid, (n, _) in counts.items()},
+                "completed": {cid: n for cid, (_, n) in counts.items()},
+            },
+        )
+
+    @contextmanager
+    def _index_locked(self):
+        with self._lock:
+            with open(f"{self.log_path}.lock", "a") as lock_file:
+                if fcntl:
+                    # Serialize with other gunicorn workers writing the same log
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    @staticmethod
+    def _read_json(path, default):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    @staticmethod
+    def _write_json_atomic(path, obj):
+        # Write-then-rename so concurrent readers never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+# Same tables, types and indexes as the PostgreSQL models (SCHEMA.md)
+SQLITE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS assignments ("
+    " id INTEGER PRIMARY KEY, participant_id VARCHAR(50), timestamp VARCHAR(50),"
+    " start_time VARCHAR(50), end_time VARCHAR(50), condition_id VARCHAR(50),"
+    " frame_type VARCHAR(20), loss_frame VARCHAR(20), is_dev BOOLEAN DEFAULT 0,"
+    " completed BOOLEAN DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS trials ("
+    " id INTEGER PRIMARY KEY, participant_id VARCHAR(50), timestamp VARCHAR(50),"
+    " condition_id VARCHAR(50), frame_type VARCHAR(20), loss_frame VARCHAR(20),"
+    " trial_number INTEGER, bar_position FLOAT, target_zone_start FLOAT,"
+    " target_zone_end FLOAT, distance_from_center FLOAT, true_outcome VARCHAR(20),"
+    " framed_outcome VARCHAR(20))",
+    "CREATE TABLE IF NOT EXISTS post_surveys ("
+    " id INTEGER PRIMARY KEY, participant_id VARCHAR(50), timestamp VARCHAR(50),"
+    " condition_id VARCHAR(50), frame_type VARCHAR(20), loss_frame VARCHAR(20),"
+    " wants_more_rounds BOOLEAN, desired_rounds_next_time INTEGER,"
+    " improvement_confidence INTEGER, learning_potential INTEGER, expected_success INTEGER,"
+    " app_download_likelihood INTEGER, confidence_impact INTEGER,"
+    " feedback_credibility INTEGER, self_rated_accuracy INTEGER,"
+    " final_round_closeness INTEGER, frustration INTEGER, motivation INTEGER,"
+    " luck_vs_skill INTEGER)",
+    "CREATE TABLE IF NOT EXISTS summaries ("
+    " id INTEGER PRIMARY KEY, participant_id VARCHAR(50), timestamp VARCHAR(50),"
+    " condition_id VARCHAR(50), frame_type VARCHAR(20), loss_frame VARCHAR(20),"
+    " trial_count INTEGER, hits INTEGER, near_misses INTEGER, losses INTEGER,"
+    " age INTEGER, gender VARCHAR(20), bdm_course_member BOOLEAN)",
+    "CREATE TABLE IF NOT EXISTS condition_counters ("
+    " condition_id VARCHAR(50) PRIMARY KEY, assigned INTEGER NOT NULL DEFAULT 0,"
+    " completed INTEGER NOT NULL DEFAULT 0)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_assignments_participant_id ON assignments (participant_id)",
+    # Balancing reads condition_counters; drop the old partial index from existing files
+    "DROP INDEX IF EXISTS ix_assignments_completed_condition",
+    "CREATE INDEX IF NOT EXISTS ix_trials_participant_trial ON trials (participant_id, trial_number)",
+    "CREATE INDEX IF NOT EXISTS ix_post_surveys_participant_id ON post_surveys (participant_id)",
+    "CREATE INDEX IF NOT EXISTS ix_summaries_participant_id ON summaries (participant_id)",
+]
+
+SQLITE_INSERT = {
+    table: f"INSERT INTO {table} ({', '.join(columns(table))}) "
+    f"VALUES ({', '.join('?' * len(columns(table)))})"
+    for table in EXPORT_FIELDS
+}
+
+
+class SQLiteStorage(Storage):
+    """The experiment tables in one local SQLite file (WAL mode).
+
+    Each process (gunicorn worker) keeps one connection, shared by its threads
+    under a lock. Writes run in BEGIN IMMEDIATE transactions, so workers queue
+    on SQLite's write lock instead of failing mid-transaction; WAL lets
+    readers and exports carry on meanwhile. Statements are fixed strings, so
+    sqlite3's statement cache prepares each one once per connection.
+    """
+
+    WRITE_BEHIND_TABLES = ("trials", "post_surveys", "summaries")
+
+    def __init__(self, path, condition_ids, busy_timeout=30.0):
+        super().__init__(condition_ids)
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.write_behind = None
+        self._lock = threading.RLock()
+        self._conn_pid = None
+        self._connection = None
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SQLITE_SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Autocommit mode; transactions are explicit (see _write)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        # WAL + NORMAL syncs only at checkpoints; a power cut can lose the last commits, never corrupt
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _conn(self):
+        if self._conn_pid != os.getpid():
+            # A connection inherited across fork must not be used or closed by the child
+            self._connection = self._connect()
+            self._conn_pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def insert_many(self, table, records):
+        if self.write_behind and table in self.WRITE_BEHIND_TABLES:
+            for record in records:
+                self.write_behind.put(table, project(table, record))
+            return
+        fields = columns(table)
+        with self._write() as conn:
+            conn.executemany(SQLITE_INSERT[table], [[r.get(f) for f in fields] for r in records])
+
+    def flush(self, batch):
+        """WriteBehindQueue callback: one transaction, one executemany per table."""
+        rows_by_table = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        with self._write() as conn:
+            for table, rows in rows_by_table.items():
+                fields = columns(table)
+                conn.executemany(SQLITE_INSERT[table], [[row.get(f) for f in fields] for row in rows])
+
+    def scan(self, table, since=None):
+        fields = EXPORT_FIELDS[table]
+        sql = f"SELECT {', '.join(fields)} FROM {table}"
+        params = ()
+        if since:
+            # Same rule as changed_at()
+            column = "COALESCE(end_time, timestamp)" if table == "assignments" else "timestamp"
+            sql += f" WHERE {column} > ?"
+            params = (since,)
+        # Own connection: a long export must not hold the worker's connection lock
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql + " ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(SCAN_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_dict(fields, row)
+        finally:
+            conn.close()
+
+    def count_by_condition(self):
+        counts = self._empty_counts()
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT condition_id, assigned, completed FROM condition_counters"
+            ).fetchall()
+        for condition_id, assigned, completed in rows:
+            if condition_id in counts:
+                counts[condition_id] = (assigned, completed)
+        return counts
+
+    def prepare(self):
+        with self._lock:
+            rows = self._conn().execute("SELECT COUNT(*) FROM condition_counters").fetchone()[0]
+        if rows < len(self.condition_ids):
+            self.reconcile()
+
+    def reconcile(self):
+        """Rebuild condition_counters from the assignments table."""
+        counts = self._empty_counts()
+        with self._write() as conn:
+            rows = conn.execute(
+                "SELECT condition_id, COUNT(*), COALESCE(SUM(completed), 0) FROM assignments "
+                "WHERE participant_id NOT LIKE 'DEV_%' GROUP BY condition_id"
+            )
+            for condition_id, assigned, completed in rows:
+                if condition_id in counts:
+                    counts[condition_id] = (assigned, completed)
+            conn.executemany(
+                "INSERT INTO condition_counters (condition_id, assigned, completed) VALUES (?, ?, ?) "
+                "ON CONFLICT(condition_id) DO UPDATE SET "
+                "assigned = excluded.assigned, completed = excluded.completed",
+                [(cid, assigned, completed) for cid, (assigned, completed) in counts.items()],
+            )
+        return counts
+
+    def claim_condition(self, participant_id):
+        """Pick the least-completed condition and count the assignment in one transaction."""
+        with self._write() as conn:
+            rows = conn.execute("SELECT condition_id, completed FROM condition_counters").fetchall()
+            completed = {cid: n for cid, n in rows if cid in self.condition_ids}
+            min_count = min(completed.values())
+            chosen = random.choice([c for c, n in completed.items() if n == min_count])
+            self._bump(conn, chosen, participant_id, assigned=1)
+        frame_type, loss_frame = chosen.split("_", 1)
+        return frame_type, loss_frame
+
+    def start_assignment(self, participant_id, frame_type, loss_frame, is_dev=False, claimed=False):
+        timestamp = datetime.now().isoformat()
+        condition_id = f"{frame_type}_{loss_frame}"
+        with self._write() as conn:
+            old = conn.execute(
+                "SELECT condition_id, completed FROM assignments WHERE participant_id = ?",
+                (participant_id,),
+            ).fetchone()
+            if old is not None:
+                # Re-used participant_id: move its counts off the previous condition
+                self._bump(conn, old[0], participant_id, assigned=-1, completed=-1 if old[1] else 0)
+            conn.execute(
+                "INSERT INTO assignments (participant_id, timestamp, start_time, end_time, "
+                "condition_id, frame_type, loss_frame, is_dev, completed) "
+                "VALUES (?, ?, ?, NULL, ?, ?, ?, ?, 0) "
+                "ON CONFLICT(participant_id) DO UPDATE SET timestamp = excluded.timestamp, "
+                "start_time = excluded.start_time, end_time = NULL, "
+                "condition_id = excluded.condition_id, frame_type = excluded.frame_type, "
+                "loss_frame = excluded.loss_frame, is_dev = excluded.is_dev, completed = 0",
+                (participant_id, timestamp, timestamp, condition_id, frame_type, loss_frame, bool(is_dev)),
+            )
+            if not claimed:
+                self._bump(conn, condition_id, participant_id, assigned=1)
+
+    def complete_session(self, participant_id, build_summary):
+        with self._write() as conn:
+            assignment = conn.execute(
+                "SELECT condition_id, completed, start_time FROM assignments WHERE participant_id = ?",
+                (participant_id,),
+            ).fetchone()
+            counts = None
+            if not self.write_behind:
+                counts = tuple(
+                    conn.execute(
+                        "SELECT COUNT(*), "
+                        "COALESCE(SUM(framed_outcome = 'hit'), 0), "
+                        "COALESCE(SUM(framed_outcome = 'near_miss'), 0), "
+                        "COALESCE(SUM(framed_outcome = 'loss'), 0) "
+                        "FROM trials WHERE participant_id = ? AND timestamp >= ?",
+                        (participant_id, assignment[2] if assignment else ""),
+                    ).fetchone()
+                )
+            summary = build_summary(counts)
+
+            # Completion, counter bump and summary row commit together
+            if assignment is not None:
+                if not assignment[1]:
+                    self._bump(conn, assignment[0], participant_id, completed=1)
+                conn.execute(
+                    "UPDATE assignments SET completed = 1, end_time = ? WHERE participant_id = ?",
+                    (datetime.now().isoformat(), participant_id),
+                )
+            fields = columns("summaries")
+            conn.execute(SQLITE_INSERT["summaries"], [summary.get(f) for f in fields])
+        return summary
+
+    def _bump(self, conn, condition_id, participant_id, assigned=0, completed=0):
+        if is_dev_participant(participant_id) or condition_id not in self.condition_ids:
+            return
+        conn.execute(
+            "UPDATE condition_counters SET assigned = assigned + ?, completed = completed + ? "
+            "WHERE condition_id = ?",
+            (assigned, completed, condition_id),
+        )
+
+    def close(self):
+        if self.write_behind:
+            self.write_behind.close()
+
+    @staticmethod
+    def _row_dict(fields, row):
+        out = dict(zip(fields, row))
+        for f in BOOLEAN_FIELDS.intersection(out):
+            if out[f] is not None:
+                out[f] = bool(out[f])
+        return out
+
+
+class MemoryStorage(Storage):
+    """Tables as in-process lists; nothing survives a restart."""
+
+    def __init__(self, condition_ids):
+        super().__init__(condition_ids)
+        self._tables = {table: [] for table in EXPORT_FIELDS}
+        self._assignments = {}
+        self._trials_by_participant = {}
+        self._next_id = {table: 1 for table in EXPORT_FIELDS}
+        self._lock = threading.Lock()
+
+    def insert_many(self, table, records):
+        with self._lock:
+            for record in records:
+                self._insert(table, project(table, record))
+
+    def scan(self, table, since=None):
+        with self._lock:
+            if table == "assignments":
+                rows = sorted(self._assignments.values(), key=lambda r: r["id"])
+            else:
+                rows = list(self._tables[table])
+        for row in rows:
+            if since and changed_at(table, row) <= since:
+                continue
+            yield dict(row)
+
+    def count_by_condition(self):
+        assigned = {cid: 0 for cid in self.condition_ids}
+        completed = {cid: 0 for cid in self.condition_ids}
+        with self._lock:
+            for participant_id, row in self._assignments.items():
+                condition_id = row["condition_id"]
+                if condition_id in assigned and not is_dev_participant(participant_id):
+                    assigned[condition_id] += 1
+                    completed[condition_id] += bool(row["completed"])
+        return {cid: (assigned[cid], completed[cid]) for cid in self.condition_ids}
+
+    def start_assignment(self, participant_id, frame_type, loss_frame, is_dev=False, claimed=False):
+        timestamp = datetime.now().isoformat()
+        row = {
+            "participant_id": participant_id,
+            "timestamp": timestamp,
+            "start_time": timestamp,
+            "end_time": None,
+            "condition_id": f"{frame_type}_{loss_frame}",
+            "frame_type": frame_type,
+            "loss_frame": loss_frame,
+            "is_dev": bool(is_dev),
+            "completed": False,
+        }
+        with self._lock:
+            self._assignments.pop(participant_id, None)
+            self._insert("assignments", row)
+
+    def complete_session(self, participant_id, build_summary):
+        with self._lock:
+            assignment = self._assignments.get(participant_id)
+            since = assignment["start_time"] if assignment else ""
+            trials = [
+                t for t in self._trials_by_participant.get(participant_id, []) if t["timestamp"] >= since
+            ]
+        summary = build_summary(tally_outcomes(trials))
+        with self._lock:
+            if assignment is not None:
+                assignment["completed"] = True
+                assignment["end_time"] = datetime.now().isoformat()
+            self._insert("summaries", project("summaries", summary))
+        return summary
+
+    def _insert(self, table, row):
+        row["id"] = self._next_id[table]
+        self._next_id[table] += 1
+        if table == "assignments":
+            self._assignments[row["participant_id"]] = row
+            return
+        self._tables[table].append(row)
+        if table == "trials":
+            self._trials_by_participant.setdefault(row["participant_id"], []).append(row)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN check for the hot PostgreSQL queries.
+Run against a scratch or staging database after migrations:
+
+  DATABASE_URL=postgresql://... python test_indexes.py
+
+Sequential scans are disabled for the session so the planner picks an index
+whenever one can serve the query, even on small tables.
+"""
+
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOT_QUERIES = [
+    (
+        "start-session: claim the least-completed condition",
+        "UPDATE condition_counters SET assigned = assigned + 1 "
+        "WHERE condition_id = ("
+        "  SELECT condition_id FROM condition_counters"
+        "  ORDER BY completed, random() LIMIT 1 FOR UPDATE SKIP LOCKED"
+        ") RETURNING condition_id",
+        "condition_counters_pkey",
+    ),
+    (
+        "start-session / get-summary: assignment for one participant",
+        "SELECT * FROM assignments WHERE participant_id = 'P00000'",
+        "ix_assignments_participant_id",
+    ),
+    (
+        "get-summary: trial outcome counts for one participant",
+        "SELECT count(id), count(id) FILTER (WHERE framed_outcome = 'hit'), "
+        "count(id) FILTER (WHERE framed_outcome = 'near_miss'), "
+        "count(id) FILTER (WHERE framed_outcome = 'loss') "
+        "FROM trials WHERE participant_id = 'P00000' AND timestamp >= '2026-01-01'",
+        "ix_trials_participant_trial",
+    ),
+    (
+        "get-summary: bump the completed counter",
+        "UPDATE condition_counters SET assigned = assigned + 0, completed = completed + 1 "
+        "WHERE condition_id = 'skill_near_miss'",
+        "condition_counters_pkey",
+    ),
+]
+
+
+def check_query_plans() -> bool:
+    print("[check] Hot query plans")
+    # Importing app creates the tables and applies migrations
+    import app as app_module
+    from sqlalchemy import text
+
+    ok = True
+    with app_module.app.app_context():
+        with app_module.db.engine.connect() as conn:
+            conn.execute(text("SET enable_seqscan = off"))
+            for label, sql, index_name in HOT_QUERIES:
+                plan = "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}")))
+                if index_name in plan:
+                    print(f"  ok: {label} ({index_name})")
+                else:
+                    print(f"  fail: {label} does not use {index_name}")
+                    print("    " + plan.replace("\n", "\n    "))
+                    ok = False
+    return ok
+
+
+def main() -> int:
+    if not os.environ.get("DATABASE_URL"):
+        print("ERROR: DATABASE_URL not set (in env or .env)")
+        return 1
+    return 0 if check_query_plans() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Check that the Parquet cache returns the same frames as a direct parse.
+
+  pip install pyarrow
+  python test_parquet_cache.py
+
+Writes JSONL with mixed-type, nested and out-of-int64 values to a temp directory and
+compares load_record_frames() with and without the cache (cache build, warm
+read and after an append), and load_table() for a JSON export.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+import analyze_data
+import analyze_data_exports
+import parquet_cache
+
+RECORDS = [
+    {"record_type": "post_survey", "participant_id": "P0001", "desired_rounds_next_time": 3,
+     "age": 25, "extra": {"a": 1}, "device_id": 2**63, "timestamp": "2026-03-01T10:00:00"},
+    {"record_type": "post_survey", "participant_id": "P0002", "desired_rounds_next_time": "4",
+     "age": "31", "extra": [1, 2], "device_id": 10**30, "timestamp": "2026-03-01T10:05:00"},
+    {"record_type": "summary", "participant_id": "P0001", "trials": [{"trial_number": 1}],
+     "bdm_course_member": True, "gender": None, "seed": 2**64 + 1, "timestamp": "2026-03-01T10:01:00"},
+]
+APPENDED = [
+    {"record_type": "post_survey", "participant_id": "P0003", "desired_rounds_next_time": 5.5,
+     "age": None, "extra": "text", "device_id": 10**400, "timestamp": "2026-03-02T09:00:00"},
+]
+# Ints outside int64: pandas makes uint64 / object columns
+BIG_INTS = [
+    {"participant_id": "P0001", "device_id": 2**63, "seed": 10**30},
+    {"participant_id": "P0002", "device_id": 5, "seed": None},
+]
+
+
+def write_jsonl(path, records, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def frames_match(label, expected, actual) -> bool:
+    ok = True
+    for record_type in sorted(set(expected) | set(actual)):
+        try:
+            pd.testing.assert_frame_equal(
+                expected[record_type].reset_index(drop=True),
+                actual[record_type].reset_index(drop=True),
+            )
+        except (AssertionError, KeyError) as exc:
+            print(f"  fail: {label} {record_type}: {exc}")
+            ok = False
+    if ok:
+        print(f"  ok: {label}")
+    return ok
+
+
+def check_jsonl_cache(data_dir) -> bool:
+    print("[check] JSONL cache matches --no-cache")
+    path = os.path.join(data_dir, "P0001.jsonl")
+    write_jsonl(path, RECORDS)
+
+    ok = True
+    direct = analyze_data.load_record_frames(data_dir, workers=1, use_cache=False)
+    ok &= frames_match("cache build", direct, analyze_data.load_record_frames(data_dir, workers=1))
+    ok &= frames_match("warm read", direct, analyze_data.load_record_frames(data_dir, workers=1))
+
+    write_jsonl(path, APPENDED, mode="a")
+    direct = analyze_data.load_record_frames(data_dir, workers=1, use_cache=False)
+    ok &= frames_match("after append", direct, analyze_data.load_record_frames(data_dir, workers=1))
+    return ok
+
+
+def check_export_cache(data_dir) -> bool:
+    print("[check] Export file cache matches --no-cache")
+    path = os.path.join(data_dir, "post_surveys.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([r for r in RECORDS + APPENDED if r["record_type"] == "post_survey"], f)
+
+    direct = {"post_survey": analyze_data_exports.load_table(path, "post_survey", use_cache=False)}
+    ok = frames_match("cache build", direct, {"post_survey": analyze_data_exports.load_table(path, "post_survey")})
+    ok &= frames_match("warm read", direct, {"post_survey": analyze_data_exports.load_table(path, "post_survey")})
+
+    path = os.path.join(data_dir, "big_ints.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(BIG_INTS, f)
+    direct = {"summary": analyze_data_exports.load_table(path, "summary", use_cache=False)}
+    ok &= frames_match("big ints", direct, {"summary": analyze_data_exports.load_table(path, "summary")})
+    ok &= frames_match("big ints warm", direct, {"summary": analyze_data_exports.load_table(path, "summary")})
+    return ok
+
+
+def main() -> int:
+    if not parquet_cache.available():
+        print("ERROR: pyarrow not installed (pip install pyarrow)")
+        return 1
+    data_dir = tempfile.mkdtemp(prefix="test_parquet_cache_")
+    try:
+        ok = check_jsonl_cache(data_dir)
+        ok &= check_export_cache(data_dir)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    print("\nAll checks passed." if ok else "\nSome checks failed.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
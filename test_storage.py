@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Check incremental scans (scan(table, since=...)) on the local storage backends.
+
+  python test_storage.py
+
+Runs against JSONL, SQLite and in-memory storage in a temp directory. An
+assignment started before `since` and completed after it must come back from
+an incremental scan, and so must its completion in export_records().
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from jsonl_store import JsonlAppender
+from storage import JsonlStorage, MemoryStorage, SQLiteStorage
+
+CONDITION_IDS = ["skill_near_miss", "skill_clear_loss", "luck_near_miss", "luck_clear_loss"]
+
+
+def make_backends(data_dir):
+    jsonl_dir = os.path.join(data_dir, "jsonl")
+    os.makedirs(jsonl_dir)
+    return [
+        ("jsonl", JsonlStorage(jsonl_dir, JsonlAppender(jsonl_dir), CONDITION_IDS)),
+        ("sqlite", SQLiteStorage(os.path.join(data_dir, "test.sqlite3"), CONDITION_IDS)),
+        ("memory", MemoryStorage(CONDITION_IDS)),
+    ]
+
+
+def tick():
+    # Timestamps are ISO strings; make sure consecutive ones differ
+    time.sleep(0.01)
+    return datetime.now().isoformat()
+
+
+def check_since(name, storage) -> bool:
+    storage.prepare()
+    storage.start_assignment("P00001", "skill", "near_miss")
+    storage.insert(
+        "trials",
+        {"participant_id": "P00001", "timestamp": datetime.now().isoformat(), "trial_number": 1,
+         "framed_outcome": "hit"},
+    )
+    since = tick()
+    tick()
+    storage.complete_session(
+        "P00001",
+        lambda counts: {"participant_id": "P00001", "timestamp": datetime.now().isoformat(),
+                        "condition_id": "skill_near_miss", "trial_count": 1},
+    )
+
+    ok = True
+    assignments = list(storage.scan("assignments", since))
+    if [(row["participant_id"], row["completed"]) for row in assignments] != [("P00001", True)]:
+        print(f"  fail: {name}: assignment completed after since missing: {assignments}")
+        ok = False
+    trials = list(storage.scan("trials", since))
+    if trials:
+        print(f"  fail: {name}: trial written before since returned: {trials}")
+        ok = False
+    records = list(storage.export_records(since))
+    if not any(r.get("participant_id") == "P00001" and r.get("end_time") for r in records):
+        print(f"  fail: {name}: export_records lost the completion: {records}")
+        ok = False
+    if ok:
+        print(f"  ok: {name}")
+    storage.close()
+    return ok
+
+
+def main() -> int:
+    print("[check] since= keeps assignments completed after it")
+    data_dir = tempfile.mkdtemp(prefix="test_storage_")
+    try:
+        ok = True
+        for name, storage in make_backends(data_dir):
+            ok &= check_since(name, storage)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    print("\nAll checks passed." if ok else "\nSome checks failed.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
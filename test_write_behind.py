@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Check that write-behind spill files are replayed after a worker crash.
+
+  python test_write_behind.py
+
+Leaves a spill file from a dead worker in a temp directory, then crashes a
+second worker right after it has claimed that file, before it could move the
+rows into its own spill. A third worker must still replay every row.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import write_behind
+from write_behind import WriteBehindQueue
+
+ROWS = [["trials", {"participant_id": "P0001", "trial_number": n}] for n in range(1, 4)]
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def crash_after_claim(spill_dir):
+    """Start a queue in a child process that dies before writing its own spill file."""
+    pid = os.fork()
+    if pid == 0:
+        WriteBehindQueue._rewrite_spill = lambda self: os._exit(1)
+        WriteBehindQueue(lambda batch: None, spill_dir)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def check_claimed_spill_replayed(spill_dir) -> bool:
+    print("[check] Rows in a claimed spill survive the claiming worker's crash")
+    with open(os.path.join(spill_dir, f"spill-{dead_pid()}.jsonl"), "w", encoding="utf-8") as f:
+        for row in ROWS:
+            f.write(json.dumps(row) + "\n")
+
+    crash_after_claim(spill_dir)
+    names = os.listdir(spill_dir)
+    if not any(".claimed-" in name for name in names):
+        print(f"  fail: crashed worker left no claimed file: {names}")
+        return False
+
+    flushed = []
+    queue = WriteBehindQueue(flushed.extend, spill_dir)
+    queue.close()
+    replayed = [[table, row] for table, row in flushed]
+    if replayed != ROWS:
+        print(f"  fail: replayed {replayed}")
+        return False
+    if os.listdir(spill_dir):
+        print(f"  fail: spill files left over: {os.listdir(spill_dir)}")
+        return False
+    print("  ok")
+    return True
+
+
+def main() -> int:
+    if not hasattr(os, "fork") or write_behind.pid_alive(dead_pid()):
+        print("SKIP: needs os.fork and a pid liveness check (POSIX)")
+        return 0
+    spill_dir = tempfile.mkdtemp(prefix="test_write_behind_")
+    try:
+        ok = check_claimed_spill_replayed(spill_dir)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    print("\nAll checks passed." if ok else "\nSome checks failed.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Write-behind queue for row inserts.
+
+Rows are appended to a local spill file and buffered in memory, then handed
+to a flush callback in batches once either the batch size or the max delay is
+reached. The spill file always holds every row that has not been flushed yet,
+so rows survive a worker crash and are replayed by the next worker to start.
+
+Each process has its own spill file (named after its pid) and flusher
+thread. A queue created before a fork (gunicorn --preload) starts over in
+the child with a new spill file and thread; rows queued before the fork stay
+with the parent.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SPILL_PREFIX = "spill-"
+# spill-<writer pid>.jsonl, plus a .claimed-<pid> suffix per worker that took it over
+SPILL_RE = re.compile(r"^spill-(\d+)\.jsonl((?:\.claimed-\d+)*)$")
+
+
+def pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) sends CTRL_C_EVENT on Windows; never claim there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but owned by someone else (or not checkable on this platform)
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    def __init__(self, flush_rows, spill_dir, max_batch=50, max_delay=2.0):
+        """``flush_rows(batch)`` receives a list of ``(table, row)`` pairs and
+        must write them all or raise."""
+        self.flush_rows = flush_rows
+        self.spill_dir = spill_dir
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._closed = False
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        """Open this process's spill file, replay orphaned spills and start the flusher."""
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.spill_path = os.path.join(self.spill_dir, f"{SPILL_PREFIX}{os.getpid()}.jsonl")
+        claimed_rows, claimed_paths = self._claim_orphaned_spills()
+        self._pending.extend(claimed_rows)
+        self._spill = open(self.spill_path, "a", encoding="utf-8")
+        self._rewrite_spill()
+        for path in claimed_paths:
+            os.remove(path)
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        # The child has no flusher thread and shares the parent's spill file;
+        # the parent's pending rows are still in that file and flushed by the parent
+        if self._closed:
+            return
+        self._start()
+
+    def put(self, table, row):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._spill.write(json.dumps([table, row]) + "\n")
+            self._spill.flush()
+            self._pending.append((table, row))
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+
+    def flush(self):
+        """Flush everything queued so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+            if not batch:
+                return 0
+            try:
+                self.flush_rows(batch)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                raise
+            with self._lock:
+                # Rows queued while the batch was in flight stay in the spill
+                self._rewrite_spill()
+            return len(batch)
+
+    def close(self):
+        if self._closed:
+            return
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("write-behind: final flush failed, rows kept in %s", self.spill_path)
+        with self._lock:
+            self._closed = True
+            self._spill.close()
+            if not self._pending:
+                os.remove(self.spill_path)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("write-behind: flush failed, retrying in %.1fs", self.max_delay)
+                time.sleep(self.max_delay)
+
+    def _rewrite_spill(self):
+        tmp_path = f"{self.spill_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for table, row in self._pending:
+                f.write(json.dumps([table, row]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._spill.close()
+        os.replace(tmp_path, self.spill_path)
+        self._spill = open(self.spill_path, "a", encoding="utf-8")
+
+    def _claim_orphaned_spills(self):
+        """Load rows left behind by workers that are no longer running.
+
+        That includes files another worker claimed but died with before
+        moving the rows into its own spill file.
+        """
+        rows = []
+        paths = []
+        for name in sorted(os.listdir(self.spill_dir)):
+            match = SPILL_RE.match(name)
+            if not match:
+                continue
+            # The last worker to claim the file owns it, else the one that wrote it
+            writer_pid, claims = match.groups()
+            owner = int(claims.rsplit("-", 1)[1] if claims else writer_pid)
+            if owner != os.getpid() and pid_alive(owner):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            claimed = f"{path}.claimed-{os.getpid()}"
+            try:
+                # Rename first so two starting workers never replay the same file
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        table, row = json.loads(line)
+                        rows.append((table, row))
+            paths.append(claimed)
+        if rows:
+            logger.warning("write-behind: replaying %d spilled rows", len(rows))
+        return rows, paths